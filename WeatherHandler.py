@@ -1,21 +1,27 @@
-import requests
+import asyncio
+import json
 import pandas as pd
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 import os
-import joblib
 
+import backfill
+import data_writer
+import features
 import helper_funcs
+import http_client
+import interpolation
+import jobs
 import ml
-
-conditions = [
-                "temperature_2m", "relative_humidity_2m", "dew_point_2m",
-                "apparent_temperature", "precipitation_probability", "precipitation",
-                "rain", "showers", "snowfall", "snow_depth", "weather_code",
-                "pressure_msl", "surface_pressure", "cloud_cover", "cloud_cover_low",
-                "cloud_cover_mid", "cloud_cover_high", "visibility",
-                "evapotranspiration", "et0_fao_evapotranspiration",
-                "vapour_pressure_deficit"
-            ]
+import model_registry
+import perf
+import retention
+import schema
+import storage
+import training_data
+import tuning
+from schema import conditions, columns
+from weather_cache import WeatherCache
 
 class WeatherHandler:
     """
@@ -23,47 +29,106 @@ class WeatherHandler:
     and logging of user-reported pain levels alongside the weather data.
     """
 
-    def __init__(self, csv_path='data.csv', pain_model='pain_model.pkl'):
-        self.csv_path = csv_path
+    def __init__(self, db_path='data.db', pain_model='pain_model.pkl', csv_path='data.csv',
+                 http=None, forecast_url=http_client.FORECAST_URL, weather_cache=None,
+                 pain_fill='linear', max_gap_hours=72, config=None, name='default', job_runner=None, tune_runner=None,
+                 hot_days=retention.HOT_DAYS, archive_days=retention.ARCHIVE_DAYS):
+        #name identifies this handler's data partition (tenant) in shared resources
+        self.name = name
+        self.config = config or helper_funcs.default_config()
+        self.db_path = db_path
         self.pain_model = pain_model
-        if os.path.isfile(csv_path) == False:
-            self.init_data()
-
-    def get_weather(self, past:str, future:str):
-        """Fetches hourly weather data from the Open-Meteo API."""
-        config = helper_funcs.get_config()
+        #how hours between two pain logs get filled, see interpolation.STRATEGIES
+        self.pain_fill = pain_fill
+        self.max_gap_hours = max_gap_hours
+        #hours older than hot_days move to archive/ (see retention.py), segments older than archive_days are dropped
+        self.hot_days = hot_days
+        self.archive_days = archive_days
+        self.http = http or http_client.get_client()
+        self.forecast_url = forecast_url
+        self.weather_cache = weather_cache or WeatherCache()
+        self.jobs = job_runner or jobs.JobRunner()
+        #hyperparameter searches run for minutes, on their own pool so they never hold up training / stats
+        self.tuning = tune_runner or jobs.JobRunner()
+        #keeps the model resident, reloads only when pain_model changes on disk
+        self.models = model_registry.ModelRegistry(pain_model)
+        self.forecast_snapshot = {}
+        self.snapshot_time = None
+        #backfills / pain imports in progress
+        self.importing = 0
+        #(mode, task) of the model update in progress, see update_model
+        self._model_update = None
+        self.store = storage.SQLiteStore(db_path, columns, schema.dtypes)
+        #every write to the store / previous_time goes through here (see data_writer.py)
+        self.writer = data_writer.DataWriter(self.store, self.config)
+
+        if os.path.isfile(csv_path) and self.store.get_meta(storage.MIGRATED) is None:
+            if self.store.bounds()[0] is None:
+                #one-shot migration from the legacy data.csv layout
+                storage.migrate_csv(csv_path, self.store)
+            else:
+                #store written before migrations were flagged
+                self.store.set_meta(storage.MIGRATED, csv_path)
+        #rebuilds itself if the feature definitions changed since the table was written
+        self.features = features.FeatureStore(self.store)
+
+    async def setup(self):
+        """Fetches the initial week of weather if the data store is still empty (and a location is set)."""
+        first, _ = self.store.bounds()
+        if first is None and self.config.get() is not None:
+            await self.init_data()
+
+    async def get_weather(self, past:str, future:str):
+        """
+        Fetches hourly weather data from the Open-Meteo API without blocking the event loop.
+        Served from the weather cache, only missing / expired days go over the network.
+        """
+        config = self.config.get()
         if config is None:
             return
 
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": config['lat'],
-            "longitude": config['log'],
-            "hourly": ",".join(conditions),
-            "timezone": config['timezone'],
-            "start_date": f"{past}",
-            "end_date": f"{future}"
-        }
-
-        response = requests.get(url, params=params)
-        return response.json()
-
-    def init_data(self):
-        """Initializes the CSV file with weather data and a placeholder pain_level column."""
-        today = datetime.now()
+        async def fetch(start_date, end_date) :
+            params = {
+                "latitude": config['lat'],
+                "longitude": config['log'],
+                "hourly": ",".join(conditions),
+                "timezone": config['timezone'],
+                "start_date": f"{start_date}",
+                "end_date": f"{end_date}"
+            }
+            return await self.http.get_json(self.forecast_url, params=params)
+
+        return await self.weather_cache.get(
+            fetch, config['lat'], config['log'], config['timezone'], conditions, past, future
+        )
+
+    def local_now(self) -> datetime :
+        """Wall clock time in the location's timezone (the server's without one), naive like the stored hours."""
+        config = self.config.get()
+        if config is None or 'timezone' not in config :
+            return datetime.now()
+        return datetime.now(ZoneInfo(config['timezone'])).replace(tzinfo=None)
+
+    async def init_data(self):
+        """Initializes the data store with weather data and a placeholder pain_level column."""
+        today = self.local_now()
         today_date = today.date()
         next_week = today_date + timedelta(days=7)
 
-        data = self.get_weather(str(today_date),str(next_week))
+        data = await self.get_weather(str(today_date),str(next_week))
         custom_data = self.add_columns(data)
-        custom_data.to_csv(self.csv_path, index_label='time')
-
         #adds to config.json, previous_time = today at current time
         today_str = self._clean_timestamp(str(today))
-        helper_funcs.append_config('previous_time',str(today_str)) #correct
-        self.routine()
+        await self.writer.submit(self._apply_init, custom_data, str(today_str))
+        await self.routine()
+
+        print(f"{self.db_path} initalized")
 
-        print(f"{self.csv_path} initalized")
+    def _apply_init(self, custom_data, previous_time) :
+        self.store.upsert(custom_data)
+        self.features.refresh(custom_data.index[0], custom_data.index[-1])
+        self.store.set_meta('last_refresh', self.local_now().isoformat())
+        self.writer.update_config({'previous_time' : previous_time}) #correct
 
     def _clean_timestamp(self, timestamp: str) :
         """
@@ -77,70 +142,84 @@ class WeatherHandler:
         clean_ts = ts.replace(minute=0,second=0,microsecond=0)
         return clean_ts
 
-    def log_pain(self, timestamp: str, pain_level: float):
+    async def log_pain(self, timestamp: str, pain_level: float):
         """
         Records a new pain_level entry at `timestamp`, interpolating or
         filling previous entries as needed.
         """
-        prev_ts = self._get_previous_timestamp()
         clean_ts = self._clean_timestamp(timestamp)
-        self.update_pain(clean_ts, pain_level, prev_ts)
+        #previous_time is read inside the writer, a pain log queued just before is already applied
+        await self.writer.submit(self._apply_pain_batch, [(clean_ts, pain_level)], None, True)
 
     def _get_previous_timestamp(self):
-        """Retrieves the last-logged timestamp from the config."""
-        config = helper_funcs.get_config()
-        return config.get('previous_time') if config and 'previous_time' in config else None
+        """Retrieves the last-logged timestamp (as the writer sees it, pending updates included)."""
+        return self.writer.get_config('previous_time')
 
-    def update_pain(self, timestamp: str, pain_level: float, prev_timestamp: str):
+    async def update_pain(self, timestamp: str, pain_level: float, prev_timestamp: str):
         """
-        Updates the CSV:
-        - If prev_timestamp exists, fills in the pain_level from prev_timestamp to timestamp,
-          handling day boundaries.
+        Updates the data store:
+        - If prev_timestamp exists, fills in the pain_level from prev_timestamp to timestamp
+          using the configured interpolation strategy (multi-day gaps included).
         - Otherwise, simply logs the pain_level at timestamp.
         """
-        df = pd.read_csv(self.csv_path, index_col='time', parse_dates=['time'])
-        
-        start_idx = df.index.get_loc(prev_timestamp)
-        end_idx = df.index.get_loc(timestamp)
+        await self.update_pain_batch([(timestamp, pain_level)], prev_timestamp)
 
-        d1 = datetime.fromisoformat(prev_timestamp)
-        d2 = datetime.fromisoformat(str(timestamp))
-        delta = d2 - d1
-        
-        #only needed when backfilling / interpolating
-        prev_pain = df.iloc[start_idx]['pain_level']
-
-        if start_idx == end_idx : 
-            df.iloc[start_idx, df.columns.get_loc('pain_level')] = pain_level
-            print(f"Pain logged for [{timestamp} @ {float(pain_level)}]")
-        elif delta.days > 0:
-            # Fill prev_timestamp's day for same pain_level (end abruptly prev time at EOD)
-            eod = prev_timestamp[:-8] + "23:00:00"
-            eod_idx = df.index.get_loc(eod) 
-            df.iloc[start_idx:(eod_idx+1), df.columns.get_loc('pain_level')] = prev_pain
-            # Log new pain_level
-            df.iloc[end_idx, df.columns.get_loc('pain_level')] = pain_level
-            print(f"Pain backfilled for [{eod} @ {float(prev_pain)}] AND logged for [{timestamp} @ {float(pain_level)}]")
-
-        else:
-            # Interpolate linearly between prev and current
-            step = self._normalize_pain(prev_pain, pain_level, start_idx, end_idx)
-            for i in range(start_idx, end_idx + 1):
-                df.iloc[i, df.columns.get_loc('pain_level')] = round(
-                    prev_pain - (step * (i - start_idx)), 1
-                )
-            print(f"Pain logged from [{prev_timestamp} @ {prev_pain}] to [{timestamp} @ {float(pain_level)}]")
-     
-        helper_funcs.append_config('previous_time', str(timestamp))
-        df.to_csv(self.csv_path)
-
-    def _normalize_pain(self, prev_pain: float, curr_pain: float, start_idx: int, end_idx: int) -> float:
+    async def update_pain_batch(self, entries, prev_timestamp: str = None):
         """
-        Calculates the per-hour decrement between prev_pain and curr_pain
-        over the interval [start_idx, end_idx].
+        Logs / corrects several (timestamp, pain_level) entries in one vectorized pass and
+        a single store write - used for bulk imports of pain diaries.
+        Hours between consecutive entries are filled per self.pain_fill (see interpolation.py).
         """
-        hours = end_idx - start_idx
-        return 0 if hours == 0 else (prev_pain - curr_pain) / hours
+        entries = list(entries)
+        if entries :
+            await self.writer.submit(self._apply_pain_batch, entries, prev_timestamp)
+
+    def _apply_pain_batch(self, entries, prev_timestamp: str = None, from_previous=False):
+        #runs in the writer, from_previous = interpolate from the last logged hour
+        if from_previous :
+            prev_timestamp = self._get_previous_timestamp()
+        entries = [(pd.Timestamp(ts), float(pain)) for ts, pain in entries]
+        if not entries :
+            return
+        prev = None
+        if prev_timestamp is not None :
+            #only needed when backfilling / interpolating
+            prev = (pd.Timestamp(prev_timestamp), self.store.get_value(prev_timestamp, 'pain_level'))
+            if prev[1] is None :
+                prev = None
+
+        times, values = interpolation.segments(
+            entries, prev, strategy=self.pain_fill, max_gap_hours=self.max_gap_hours
+        )
+        self.store.update_values('pain_level', times, values)
+
+        first, last = times[0], times[-1]
+        if len(times) == 1 :
+            print(f"Pain logged for [{last} @ {float(values[-1])}]")
+        else :
+            print(f"Pain logged from [{first} @ {float(values[0])}] to [{last} @ {float(values[-1])}] ({self.pain_fill})")
+
+        #historical corrections don't move previous_time backwards
+        latest = max(ts for ts, _ in entries)
+        current = self._get_previous_timestamp()
+        if current is None or latest >= pd.Timestamp(current) :
+            self.writer.update_config({'previous_time' : str(latest)})
+
+    async def backfill_weather(self, start, end=None, **kwargs) :
+        """Fills [start, end] with archived weather (see backfill.py), end defaults to yesterday."""
+        self.importing += 1
+        try :
+            return await backfill.Backfill(self, **kwargs).run(start, end)
+        finally :
+            self.importing -= 1
+
+    async def import_pain(self, source) :
+        """Logs a pain diary CSV (time, pain_level) through update_pain_batch."""
+        self.importing += 1
+        try :
+            return await backfill.import_pain(self, source)
+        finally :
+            self.importing -= 1
 
     def add_columns(self, data) : 
         cols = list(data['hourly'].keys())
@@ -159,159 +238,123 @@ class WeatherHandler:
 
         return df.set_index('time')
     
-    def _update_features(self, new_features, time) :
+    async def _update_features(self, new_features, time) :
         #new_features = raw weather data, json object
         #time = index to stop at
         new_forecast = self.add_columns(new_features)
-        current_data = pd.read_csv(self.csv_path, index_col='time', parse_dates=['time'])
-        
-        '''
-        get overlapping indices of current_data (from data.csv) 
-        and new_forceast (API call for next week's data)
+        await self.writer.submit(self._apply_forecast, new_forecast, time)
 
-        then overwrite current_data's conditions (default columns, excludes my additional cols)
-        with new_forecast's updated weather conditions
-        '''
-        overlap = current_data.index.intersection(new_forecast.index)
-        current_data.loc[overlap, conditions] = new_forecast.loc[overlap, conditions]
-       
-        '''
-        update values for 'is_actual' column from [prev_update_day @ 12AM, todays_date @ AM/PM] to be TRUE
-        '''
-        start = current_data.index[0]
-        end = time
-        current_data.loc[start:end, 'is_actual'] = True
+    def _apply_forecast(self, new_forecast, time) :
 
         '''
-        this is all new, relative to [current_data]
+        upsert new_forecast (API call for next week's data) into the store
 
-        get disjoint set of indices from new_forecast (=new_indices)
-        then use those new_indices to copy new_forecast's values (=new_rows)
-        finally append those new_rows onto our current_data (=updated_data)
+        overlapping hours only get their conditions (default columns, excludes my additional cols)
+        overwritten with new_forecast's updated weather conditions, new hours are inserted whole
         '''
         #there shouldn't be new rows, but if there are, its handled gracefully
-        new_indices = new_forecast.index.difference(current_data.index) #bunch of timedate objects
-        new_rows = new_forecast.loc[new_indices] 
-        
-        updated_data = pd.concat([current_data, new_rows])
-        updated_data = updated_data.sort_index()
-        updated_data.to_csv(self.csv_path)
-
-        print(f'Actuals updated from [{start}] to [{end}]')
+        self.store.upsert(new_forecast, columns=conditions)
+        self.features.refresh(new_forecast.index[0], new_forecast.index[-1])
+        #committed with the weather, shown by /forecast - a failing refresh leaves it behind
+        self.store.set_meta('last_refresh', self.local_now().isoformat())
 
-
-    #updates and adds weather data from range[start_date,end_date] into data.csv
-    def _update_forecast_range(self, start_date ,end_date) :
-        data = self.get_weather(str(start_date.date()), str(end_date.date()))
-
-        new_forecast = self.add_columns(data)
-        current_data = pd.read_csv(self.csv_path, index_col='time', parse_dates=['time'])
-        
         '''
-        get overlapping indices of current_data (from data.csv) 
-        and new_forceast (API call for next week's data)
-
-        then overwrite current_data's conditions (default columns, excludes my additional cols)
-        with new_forecast's updated weather conditions
+        update values for 'is_actual' column from [prev_update_day @ 12AM, todays_date @ AM/PM] to be TRUE
+        (only hours that are still forecasts get touched)
         '''
-        overlap = current_data.index.intersection(new_forecast.index)
-        current_data.loc[overlap, conditions] = new_forecast.loc[overlap, conditions]
+        start, _ = self.store.bounds()
+        end = time
+        self.store.update_range('is_actual', True, end=end, is_actual=False)
 
-        #update 'is_actual' to be true up until NOW 
-        now = self._clean_timestamp(str(datetime.now()))
-        start = current_data.index[0]
-        current_data.loc[start:now, 'is_actual'] = True
+        print(f'Actuals updated from [{start}] to [{end}]')
 
-        '''
-        this is all new, relative to [current_data]
 
-        get disjoint set of indices from new_forecast (=new_indices)
-        then use those new_indices to copy new_forecast's values (=new_rows)
-        finally append those new_rows onto our current_data
-        '''
-        new_indices = new_forecast.index.difference(current_data.index) #bunch of timedate objects
-        new_rows = new_forecast.loc[new_indices] 
+    #updates and adds weather data from range[start_date,end_date] into the data store
+    async def _update_forecast_range(self, start_date ,end_date) :
+        data = await self.get_weather(str(start_date.date()), str(end_date.date()))
 
-        updated_data = pd.concat([current_data, new_rows])
-        updated_data = updated_data.sort_index()
-        updated_data.to_csv(self.csv_path)
+        new_forecast = self.add_columns(data)
 
-        print(f'Actuals updated from [{str(start_date.date())}] to [{end_date.date()}]')
+        #same upsert + "mark as actual" as _update_features, with actuals up until NOW
+        now = self._clean_timestamp(str(self.local_now()))
+        await self.writer.submit(self._apply_forecast, new_forecast, now)
 
     #updates range[previous_time (in config.json) : ceiling(current_day_time)] weather data
     #difference is this one stops at a specific hour ? redundant?
-    def _update_forecast_hour(self, current_time) : 
-        prev_update_time = helper_funcs.get_config()['previous_time']
+    async def _update_forecast_hour(self, current_time) : 
+        prev_update_time = self.config.get()['previous_time']
                 
         prev_date = prev_update_time[0:10]
         curr_date = str(current_time.date())
 
-        data = self.get_weather(prev_date, curr_date)
-        self._update_features(data, current_time)
+        data = await self.get_weather(prev_date, curr_date)
+        await self._update_features(data, current_time)
 
-    def routine(self) :
-        now_ts = self._clean_timestamp(str(datetime.now()))
+    async def routine(self) :
+        now_ts = self._clean_timestamp(str(self.local_now()))
         hour = int(now_ts.hour)
         
         # this runs when actuals for for current hour matter like pain log / forecasting 
         if hour == hour :
-            self.intraday_routine(now_ts)
+            await self.intraday_routine(now_ts)
         # # day just ended - update actuals for prev day & get forecast for next week
         if hour == 0 :
             yesterday = now_ts - timedelta(days=1)
             next_week = now_ts + timedelta(days=7)
-            self.forecast_routine(yesterday, now_ts, next_week)
+            await self.forecast_routine(yesterday, now_ts, next_week)
     
-    def intraday_routine(self, time) : 
-        self._update_forecast_hour(time)
+    async def intraday_routine(self, time) : 
+        await self._update_forecast_hour(time)
         print(f'Intraday update finished at [{datetime.now()}]')
 
-    def forecast_routine(self, past, now, future) : 
+    async def forecast_routine(self, past, now, future) : 
         # update yesterdays actuals (weather)
-        self._update_forecast_range(past, past) 
+        await self._update_forecast_range(past, past) 
         # update next weeks forecast (weather)
-        self._update_forecast_range(now, future) 
+        await self._update_forecast_range(now, future) 
         # update next weeks forecast (pain) if painmodel exists
         if os.path.isfile(self.pain_model) == True:
-            self.model_pain(False)
+            await self.model_pain(False)
         print(f'Forecast update finished at [{datetime.now()}]')
 
-    def model_pain(self, is_actual:bool) : 
+    async def model_pain(self, is_actual:bool) : 
         try :
-            model = joblib.load(self.pain_model)
-            print(f"Loaded model : {self.pain_model}")  
+            model = self.models.get()
         except Exception as e: 
             print(f"Model load error : {e}")
             return
+        if model is None :
+            print(f"No model found : {self.pain_model}")
+            return
         
         try : 
-            forecast = ml.preprocess(self.csv_path, is_actual)
-            print(f"Preprocessed CSV : {self.csv_path}")
+            #ready-made features from the feature store, nothing recomputed over the history
+            forecast = ml.preprocess(self.features.read(is_actual=is_actual), is_actual)
+            print(f"Preprocessed data : {self.db_path}")
         except Exception as e: 
             print(f"Preprocess error : {e}")
             return
         
+        if forecast.empty :
+            print("No rows to predict")
+            return
+
         try :
-            features = forecast[model.feature_names_in_]
+            x = forecast[model.feature_names_in_]
         except Exception as e: 
             print(f"Missing feature(s) : {e}")
             return
 
 
-        forecast['predicted_pain'] = model.predict(features)
+        with perf.span('model.predict') :
+            forecast['predicted_pain'] = model.predict(x)
         forecast['predicted_pain'] = forecast['predicted_pain'].round(1).round()
 
-        df = pd.read_csv(self.csv_path, index_col='time', parse_dates=['time'])
-        indicies = df[df['is_actual']== is_actual].index
-        df.loc[indicies,'predicted_pain'] = forecast['predicted_pain'].values
-        df = df.sort_index()
-        df.to_csv(self.csv_path)
+        await self.writer.submit(self.store.update_values, 'predicted_pain', forecast.index, forecast['predicted_pain'])
 
-    def get_forecast(self) : 
-        self.routine()
-        df = pd.read_csv(self.csv_path, index_col='time', parse_dates=['time'])
+    def _compute_forecast(self) : 
+        df = self.store.read(is_actual=False, columns=['predicted_pain'])
 
-        df = df[df['is_actual']==False]
         df['date'] = df.index.normalize()
         dates = df.index.normalize().unique()
     
@@ -324,9 +367,160 @@ class WeatherHandler:
             pain_forecast[date] = pain_forecast.get(date,int(max_pain))
 
         return pain_forecast
+
+    def refresh_snapshot(self) :
+        """Rebuilds the in-memory 7-day forecast served by get_forecast()."""
+        self.forecast_snapshot = self._compute_forecast()
+        self.snapshot_time = datetime.now()
+
+    def last_refresh(self) :
+        """Local time the weather was last written by a refresh, None if it never was."""
+        last = self.store.get_meta('last_refresh')
+        return None if last is None else datetime.fromisoformat(last)
+
+    def get_forecast(self) : 
+        """Precomputed forecast (kept fresh by the scheduler), built on first use otherwise."""
+        if self.snapshot_time is None :
+            self.refresh_snapshot()
+        return self.forecast_snapshot
     
-    def see_stats(self) : 
-        return ml.get_stats(self.csv_path)
+    async def see_stats(self) : 
+        """Cross-validated model stats, cached in the store until the labeled data (or model config) changes."""
+        config = ml.load_model_config(self.pain_model)
+        source = self.training_source()
+        #hashed chunk by chunk, the training window never has to be in memory here
+        start = training_data.window_start(self.store, source.memory_mb)
+        archive = training_data.archive_signature(source) if training_data.uses_archive(self.store, source, start) else None
+        key = await asyncio.to_thread(ml.evaluation_key, training_data.iter_labeled(self.store, start), config, ml.CV_SPLITS, archive)
+        cached = self.store.get_meta('stats_cache')
+        if cached is not None :
+            cached = json.loads(cached)
+            if cached['key'] == key :
+                return dict(cached['stats'], cached=True)
+        stats = await self.jobs.run(f'stats:{self.name}', ml.get_stats, source, config)
+        await self.writer.submit(self.store.set_meta, 'stats_cache', json.dumps({'key' : key, 'stats' : stats}))
+        return dict(stats, cached=False)
     
-    def update_model(self) :
-        ml.update_model(self.csv_path, self.pain_model)    
\ No newline at end of file
+    def training(self) -> bool :
+        return self._model_update is not None and not self._model_update[1].done()
+
+    def busy(self) -> bool :
+        return (self.training() or self.writer.busy() or self.importing > 0
+                or self.jobs.is_running(f'stats:{self.name}') or self.tuning.is_running(f'tune:{self.name}'))
+
+    def memory_estimate(self) -> int :
+        """Rough resident bytes held by this handler (models in the registry dominate)."""
+        return self.models.nbytes() + 64_000
+
+    def close(self) :
+        self.config.flush()
+        self.store.close()
+
+    async def rollback_model(self) :
+        #the restored pickle is recompiled, off the event loop
+        rolled_back = await asyncio.to_thread(self.models.rollback)
+        if rolled_back :
+            await self.model_pain(False)
+            self.refresh_snapshot()
+        return rolled_back
+
+    def training_source(self) :
+        """What training / evaluation jobs read their labeled hours from (see training_data.py)."""
+        return training_data.Source(self.db_path)
+
+    async def tune_model(self, budget:float=300) :
+        """Searches forest configs (see tuning.py), the winner is used from the next update_model on."""
+        return await self.tuning.run(f'tune:{self.name}', tuning.tune, self.training_source(), self.pain_model, budget)
+
+    def _watermark(self) :
+        """Last labeled hour the model was trained on (model file's time for models older than the watermark)."""
+        watermark = self.store.get_meta('model_watermark')
+        if watermark is None and os.path.isfile(self.pain_model) :
+            watermark = str(self._clean_timestamp(str(datetime.fromtimestamp(os.path.getmtime(self.pain_model)))))
+        return watermark
+
+    def new_labeled_hours(self) -> int :
+        watermark = self._watermark()
+        if watermark is None :
+            return 0
+        start = pd.Timestamp(watermark) + timedelta(hours=1)
+        return self.store.count(start=start, is_actual=True, labeled=True)
+
+    def _needs_full_rebuild(self) -> bool :
+        #incremental trees only see recent hours, rebuild periodically so older history (and corrections) count again
+        return int(self.store.get_meta('incremental_updates') or 0) >= ml.FULL_REBUILD_EVERY
+
+    async def auto_update_model(self) :
+        """Scheduler hook : incremental update once enough new labeled hours are in (never creates the first model)."""
+        if not os.path.isfile(self.pain_model) or self.training() :
+            return None
+        if self.new_labeled_hours() < ml.INCREMENTAL_MIN_HOURS :
+            return None
+        return await self.update_model(incremental=True)
+
+    async def update_model(self, incremental=False) :
+        """
+        Trains (or incrementally updates) the model. A request made while an update runs joins
+        it, unless it asks for a full rebuild while an incremental update runs - that one waits
+        for the incremental update to finish, then rebuilds.
+        """
+        mode = 'incremental' if incremental else 'full'
+        while self.training() :
+            running_mode, running = self._model_update
+            if running_mode == 'full' or mode == running_mode :
+                return await asyncio.shield(running)
+            await asyncio.wait([running])
+        task = asyncio.create_task(self._update_model(incremental))
+        self._model_update = (mode, task)
+        #shield so a cancelled waiter doesn't cancel the update for everyone else
+        return await asyncio.shield(task)
+
+    async def _update_model(self, incremental) :
+        #the worker streams the labeled hours out of data.db itself, nothing is pickled over
+        data = self.training_source()
+        watermark = self._watermark()
+        if incremental and watermark is not None and not self._needs_full_rebuild() :
+            report = await self.jobs.run(f'update_model:{self.name}', ml.incremental_update, data, self.pain_model, watermark)
+        else :
+            report = await self.jobs.run(f'update_model:{self.name}', ml.update_model, data, self.pain_model, None, watermark)
+
+        if report['mode'] != 'none' :
+            await self.writer.submit(self._apply_model_report, report)
+            print(f"Model update ({report['mode']}) for [{self.name}] : {report}")
+        #picks up the new file (hashed / loaded in a thread), previous model stays available for rollback
+        await asyncio.to_thread(self.models.get)
+        #new model is in place, refresh next week's predicted pain with it
+        await self.model_pain(False)
+        self.refresh_snapshot()
+        return report
+
+    def _apply_model_report(self, report) :
+        count = int(self.store.get_meta('incremental_updates') or 0)
+        self.store.set_meta('incremental_updates', str(count + 1 if report['mode'] == 'incremental' else 0))
+        self.store.set_meta('model_watermark', report['watermark'])
+        self.store.set_meta('model_report', json.dumps(report))
+
+    async def compact_history(self) :
+        """Moves complete months older than hot_days out of data.db into archive segments (daily, from the scheduler)."""
+        directory = retention.archive_dir(self.db_path)
+        now = self.local_now()
+        months = retention.months_to_compact(self.store, now, hot_days=self.hot_days)
+        rows = 0
+        for month in months :
+            #a month per writer batch, commands queued meanwhile never wait for the whole history
+            rows += await self.writer.submit(retention.compact_month, self.store, directory, month)
+        expired = await asyncio.to_thread(retention.expire, directory, now, self.archive_days)
+        report = {'months' : len(months), 'rows' : rows, 'expired' : expired, 'hot_rows' : self.store.count()}
+        if months or expired :
+            await self.writer.submit(self.store.set_meta, 'retention_report', json.dumps(report))
+            print(f"History compacted for [{self.name}] : {report}")
+        return report
+
+    def model_stats(self) -> dict :
+        """Registry info + the last update's report (mode, drift metrics)."""
+        info = self.models.stats()
+        report = self.store.get_meta('model_report')
+        if report is not None :
+            info.update({f'last_update.{key}' : value for key, value in json.loads(report).items()})
+        info['incremental_since_rebuild'] = int(self.store.get_meta('incremental_updates') or 0)
+        return info
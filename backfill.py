@@ -0,0 +1,239 @@
+"""
+Historical weather backfill and pain diary import, so a new user can train on past data.
+
+    python backfill.py --dir users/<user id> --start 2024-01-01 --end 2024-12-31
+    python backfill.py --dir users/<user id> --pain diary.csv
+
+The date range is split into chunks on a fixed grid, fetched concurrently from an
+Open-Meteo compatible archive endpoint (paced, a few in flight at a time) and every chunk
+is written to the data store as soon as it arrives - through the handler's writer, together
+with its checkpoint, so an interrupted backfill picks up where it stopped.
+Hours already in the store or its archive (see retention.py) are never touched, new ones
+are stored unlabeled - left out of training until a pain write covers them. A pain diary (CSV with time, pain_level) goes
+through update_pain_batch, the same interpolation as /pain - import it after backfilling
+the weather for its dates, only hours in the store get a pain level.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import http_client
+import perf
+import retention
+import schema
+from weather_cache import location_key
+
+#not in the reanalysis archive, left empty (NaN) for backfilled hours
+ARCHIVE_MISSING = {"precipitation_probability", "showers", "visibility"}
+#chunks are aligned on this day so the same dates always map to the same checkpoints
+GRID_START = date(1940, 1, 1)
+
+
+def chunk_ranges(start: date, end: date, chunk_days: int = 31) -> list:
+    """[(first_day, last_day)] covering [start, end], cut on a fixed chunk_days grid."""
+    ranges = []
+    day = start
+    while day <= end:
+        offset = (day - GRID_START).days % chunk_days
+        last = min(day + timedelta(days=chunk_days - 1 - offset), end)
+        ranges.append((day, last))
+        day = last + timedelta(days=1)
+    return ranges
+
+
+class Backfill:
+    """
+    Fills a handler's store with archived hourly weather for a date range.
+    `concurrency` chunk requests in flight at once, starting at least `min_interval` apart.
+    """
+
+    def __init__(self, handler, url=http_client.ARCHIVE_URL, chunk_days=31, concurrency=4, min_interval=0.25):
+        self.handler = handler
+        self.url = url
+        self.chunk_days = chunk_days
+        self.min_interval = min_interval
+        self.variables = [col for col in schema.conditions if col not in ARCHIVE_MISSING]
+        self._limit = asyncio.Semaphore(concurrency)
+        self._pace = asyncio.Lock()
+        self._last_request = 0.0
+
+    def _checkpoint_key(self, config) -> str:
+        return "backfill:" + location_key(config['lat'], config['log'], config['timezone'])
+
+    def completed(self, config) -> list:
+        """Chunks already written for this location, as (first_day, last_day)."""
+        done = self.handler.store.get_meta(self._checkpoint_key(config))
+        return [tuple(date.fromisoformat(day) for day in chunk) for chunk in json.loads(done or "[]")]
+
+    async def _paced(self):
+        async with self._pace:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_request = time.monotonic()
+
+    async def _fetch(self, config, first: date, last: date) -> dict:
+        params = {
+            "latitude": config['lat'],
+            "longitude": config['log'],
+            "hourly": ",".join(self.variables),
+            "timezone": config['timezone'],
+            "start_date": str(first),
+            "end_date": str(last),
+        }
+        async with self._limit:
+            await self._paced()
+            return await self.handler.http.get_json(self.url, params=params)
+
+    def to_frame(self, response: dict) -> pd.DataFrame:
+        """Archive response -> store rows (actual weather, pain_level a placeholder until a diary labels it)."""
+        hourly = response['hourly']
+        frame = pd.DataFrame({col: hourly.get(col) for col in self.variables}, dtype="float64")
+        for col in ARCHIVE_MISSING:
+            frame[col] = np.nan
+        frame.index = pd.to_datetime(pd.Index(hourly['time'], name="time"))
+        frame['pain_level'] = 0.0
+        frame['predicted_pain'] = 0.0
+        frame['is_actual'] = True
+        #the archive lags a few days behind, those hours come back empty
+        return frame[frame[self.variables].notna().any(axis=1)]
+
+    def _archived(self, frame: pd.DataFrame) -> pd.DatetimeIndex:
+        """Hours of `frame` that were compacted out of the store into archive segments."""
+        directory = retention.archive_dir(self.handler.db_path)
+        first, last = frame.index[0].replace(day=1).normalize(), frame.index[-1]
+        times = [retention.segment_times(path) for month, path in retention.segments(directory) if first <= month <= last]
+        return frame.index[frame.index.isin(times[0].append(times[1:]))] if times else frame.index[:0]
+
+    def _apply(self, key: str, chunk, frame: pd.DataFrame, complete: bool) -> int:
+        #runs in the writer : rows + checkpoint land in the same commit
+        store = self.handler.store
+        if not frame.empty:
+            #archived hours are labeled already, inserted again they'd stay hot as unlabeled copies
+            frame = frame.drop(self._archived(frame))
+        #hours already in the store are left as they are, new ones wait for a pain log to become labels
+        store.insert_unlabeled(frame)
+        if not frame.empty:
+            self.handler.features.refresh(frame.index[0], frame.index[-1])
+        if complete:
+            done = json.loads(store.get_meta(key) or "[]")
+            done.append([str(chunk[0]), str(chunk[1])])
+            store.set_meta(key, json.dumps(done))
+        return len(frame)
+
+    async def _chunk(self, config, key: str, chunk) -> int:
+        response = await self._fetch(config, *chunk)
+        frame = self.to_frame(response)
+        hours = ((chunk[1] - chunk[0]).days + 1) * 24
+        #a chunk with missing hours is fetched again by the next run
+        complete = len(frame) >= hours
+        return await self.handler.writer.submit(self._apply, key, chunk, frame, complete)
+
+    @perf.timed("weather.backfill")
+    async def run(self, start, end=None) -> dict:
+        """
+        Backfills [start, end] (dates / ISO strings), end defaults to yesterday.
+        Returns {"chunks": n, "skipped": n, "failed": n, "rows": rows written}
+        """
+        config = self.handler.config.get()
+        if config is None or 'lat' not in config:
+            raise ValueError("No location set")
+        start = date.fromisoformat(str(start)[:10])
+        end = self.handler.local_now().date() - timedelta(days=1) if end is None else date.fromisoformat(str(end)[:10])
+        key = self._checkpoint_key(config)
+
+        completed = self.completed(config)
+        chunks = chunk_ranges(start, end, self.chunk_days)
+        pending = [
+            chunk for chunk in chunks
+            if not any(first <= chunk[0] and chunk[1] <= last for first, last in completed)
+        ]
+        results = await asyncio.gather(*(self._chunk(config, key, chunk) for chunk in pending), return_exceptions=True)
+        failed = [result for result in results if isinstance(result, Exception)]
+        for error in failed[:3]:
+            print(f"Backfill chunk failed for [{self.handler.name}] : {error}")
+        report = {
+            "chunks": len(chunks),
+            "skipped": len(chunks) - len(pending),
+            "failed": len(failed),
+            "rows": sum(result for result in results if not isinstance(result, Exception)),
+        }
+        print(f"Backfill {start} - {end} for [{self.handler.name}] : {report}")
+        return report
+
+
+def read_pain_csv(source, chunksize: int = 50_000):
+    """
+    Pain diary chunks as [(hour, pain_level)]. `source` = path / file object of a CSV with
+    `time` and `pain_level` columns (else the first two columns are used), times are
+    rounded to the hour like /pain does (30 minute cutoff).
+    """
+    for chunk in pd.read_csv(source, chunksize=chunksize):
+        time_col, pain_col = ("time", "pain_level") if {"time", "pain_level"} <= set(chunk.columns) else chunk.columns[:2]
+        chunk = chunk[[time_col, pain_col]].dropna()
+        hours = (pd.to_datetime(chunk[time_col], format="ISO8601") + pd.Timedelta(minutes=30)).dt.floor("h")
+        yield sorted(zip(hours, chunk[pain_col].astype(float)))
+
+
+async def import_pain(handler, source, chunksize: int = 50_000) -> dict:
+    """Logs every entry of a pain diary through update_pain_batch, interpolating across chunks."""
+    first, last = handler.store.bounds()
+    entries = outside = 0
+    prev = None
+    for chunk in read_pain_csv(source, chunksize):
+        if not chunk:
+            continue
+        #only hours that exist in the store get written
+        if first is not None:
+            outside += sum(1 for ts, _ in chunk if ts < first or ts > last)
+        await handler.update_pain_batch(chunk, prev)
+        entries += len(chunk)
+        prev = chunk[-1][0]
+    if outside:
+        print(f"{outside} pain log(s) outside the stored hours ({first} - {last}), backfill weather for them first")
+    return {"entries": entries, "outside": outside}
+
+
+if __name__ == "__main__":
+    import WeatherHandler
+    from config_store import ConfigStore
+    from weather_cache import WeatherCache
+
+    parser = argparse.ArgumentParser(description="Backfill historical weather / import a pain diary")
+    parser.add_argument("--dir", default=".", help="tenant directory holding config.json / data.db")
+    parser.add_argument("--start", help="first day (YYYY-MM-DD), defaults to the diary's first day")
+    parser.add_argument("--end", help="last day, defaults to yesterday")
+    parser.add_argument("--pain", help="pain diary CSV to import after the weather backfill")
+    parser.add_argument("--chunk-days", type=int, default=31)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    async def main():
+        handler = WeatherHandler.WeatherHandler(
+            db_path=os.path.join(args.dir, "data.db"),
+            pain_model=os.path.join(args.dir, "pain_model.pkl"),
+            csv_path=os.path.join(args.dir, "data.csv"),
+            config=ConfigStore(os.path.join(args.dir, "config.json")),
+            weather_cache=WeatherCache(os.path.join(os.path.dirname(os.path.abspath(args.dir)), "weather_cache.db")),
+            name=os.path.basename(os.path.abspath(args.dir)),
+        )
+        start = args.start
+        if start is None and args.pain:
+            start = min(chunk[0][0] for chunk in read_pain_csv(args.pain) if chunk)
+        report = {}
+        if start is not None:
+            backfill = Backfill(handler, chunk_days=args.chunk_days, concurrency=args.concurrency)
+            report["weather"] = await backfill.run(start, args.end)
+        if args.pain:
+            report["pain"] = await import_pain(handler, args.pain)
+        await handler.http.close()
+        handler.close()
+        print(json.dumps(report, indent=2))
+
+    asyncio.run(main())
@@ -0,0 +1,266 @@
+"""
+Benchmarks the bot's hot paths against synthetic histories and the local Open-Meteo stub.
+
+    python benchmark.py --sizes week,year,10y --output bench.json
+    python benchmark.py --sizes month --skip update_model,get_stats
+
+Every size gets a fresh working directory with a generated data.csv / config.json,
+so results are comparable across commits. Output is JSON:
+    {"commit": ..., "startup": {imports, prewarm},
+     "results": {size: {operation: {wall_s, peak_mb, rows, rows_per_s}}}}
+"""
+import argparse
+import asyncio
+import json
+import inspect
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+import compiled_forest
+import http_client
+import joblib
+import ml
+import model_registry
+import storage
+import stub_server
+import WeatherHandler
+from weather_cache import WeatherCache
+
+SIZES = {
+    "week": 7,
+    "month": 30,
+    "year": 365,
+    "5y": 5 * 365,
+    "10y": 10 * 365,
+}
+#pain logs submitted at once by log_pain_burst
+BURST = 50
+OPERATIONS = [
+    "log_pain", "log_pain_burst", "_update_features", "_update_forecast_range", "model_pain",
+    "get_forecast", "preprocess", "update_model", "get_stats",
+    "load_sklearn", "load_compiled", "predict_sklearn", "predict_compiled",
+]
+
+
+def synthetic_frame(days: int, seed: int = 0) -> pd.DataFrame:
+    """Hourly data.csv-schema frame covering `days` of history plus next week's forecast."""
+    rng = np.random.default_rng(seed)
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = (now - timedelta(days=days)).replace(hour=0)
+    end = now.replace(hour=23) + timedelta(days=7)
+    index = pd.date_range(start, end, freq="h", name="time")
+    n = len(index)
+    t = np.arange(n, dtype=np.float64)
+    daily = np.sin(t / 24 * 2 * np.pi)
+    slow = np.sin(t / (24 * 5) * 2 * np.pi)
+
+    data = {}
+    for col in WeatherHandler.conditions:
+        noise = rng.normal(0, 0.3, n)
+        if col == "weather_code":
+            data[col] = rng.integers(0, 4, n)
+        elif col in ("pressure_msl", "surface_pressure"):
+            data[col] = np.round(1013 + 8 * slow + daily + noise, 1)
+        elif col in ("relative_humidity_2m", "precipitation_probability") or col.startswith("cloud_cover"):
+            data[col] = np.clip(50 + 40 * daily * slow + 5 * noise, 0, 100).astype(int)
+        else:
+            data[col] = np.round(10 + 8 * daily + 4 * slow + noise, 2)
+
+    frame = pd.DataFrame(data, index=index)
+    #pain loosely follows pressure drops so the model has something to learn
+    pain = np.clip(np.round(3 - (frame["pressure_msl"] - 1013) / 3 + rng.normal(0, 0.5, n)), 0, 10)
+    frame.insert(0, "pain_level", pain)
+    frame.insert(1, "predicted_pain", 0.0)
+    frame.insert(2, "is_actual", index <= now)
+    return frame
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+#what main.py imports before logging in, and what it loads in the background afterwards
+STARTUP_IMPORTS = "import discord, helper_funcs, perf, reminders, scheduler, tenants"
+PREWARM_IMPORTS = "import WeatherHandler"
+
+
+def startup_times(repeat: int) -> dict:
+    """Best-of-`repeat` fresh interpreter import times (the bot's restart cost)."""
+    results = {}
+    for name, code in (("imports", STARTUP_IMPORTS), ("prewarm", f"{STARTUP_IMPORTS}; {PREWARM_IMPORTS}")):
+        walls = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+            walls.append(time.perf_counter() - start)
+        results[name] = {"wall_s": round(min(walls), 4)}
+        print(f"[startup] {name:<24} {min(walls):.4f}s", file=sys.stderr)
+    return results
+
+
+async def measure(fn, rows: int, repeat: int) -> dict:
+    """Median wall time over `repeat` runs, then one traced run for peak memory."""
+    async def call():
+        result = fn()
+        if inspect.isawaitable(result):
+            await result
+
+    walls = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await call()
+        walls.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    await call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    wall = statistics.median(walls)
+    return {
+        "wall_s": round(wall, 6),
+        "peak_mb": round(peak / 1e6, 3),
+        "rows": rows,
+        "rows_per_s": round(rows / wall, 1) if wall > 0 else None,
+    }
+
+
+async def bench_size(name: str, days: int, base_url: str, repeat: int, skip: set) -> dict:
+    #databases / models of a size live in a scratch directory, removed once it's measured
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix=f"jointbot-bench-{name}-") as workdir:
+        os.chdir(workdir)
+        try:
+            return await _bench_size(name, days, base_url, repeat, skip)
+        finally:
+            os.chdir(cwd)
+
+
+async def _bench_size(name: str, days: int, base_url: str, repeat: int, skip: set) -> dict:
+    frame = synthetic_frame(days)
+    storage.write_csv(frame, "data.csv")
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    with open("config.json", "w") as f:
+        json.dump({
+            "zipOrCity": "11249", "country": "US", "timezone": "America/New_York",
+            "lat": 40.6501, "log": -73.94958, "previous_time": str(now - timedelta(hours=6)),
+        }, f)
+
+    results = {}
+    start = time.perf_counter()
+    handler = WeatherHandler.WeatherHandler(
+        db_path="data.db", pain_model="pain_model.pkl", forecast_url=f"{base_url}/v1/forecast",
+        weather_cache=WeatherCache("weather_cache.db"),
+    )
+    try:
+        results["migrate"] = {"wall_s": round(time.perf_counter() - start, 6), "rows": len(frame)}
+
+        rows = len(frame)
+        labeled = int(frame["is_actual"].sum())
+        today = pd.Timestamp(now)
+        weather = await handler.get_weather(str(today.date()), str((today + timedelta(days=7)).date()))
+        data = handler.features.read(is_actual=True)
+
+        #model_pain / get_forecast need a model, train one up front (outside the timings)
+        ml.update_model(data, handler.pain_model)
+        #sklearn vs compiled forest on the forecast hours model_pain predicts
+        forest_path = compiled_forest.compiled_path(handler.pain_model)
+        sklearn_model = joblib.load(handler.pain_model)
+        compiled_model = compiled_forest.load(forest_path)
+        forecast_x = ml.get_features(ml.preprocess(handler.features.read(is_actual=False), False))
+        forecast_x = forecast_x[sklearn_model.feature_names_in_]
+        results["compiled_forest"] = {
+            "sklearn_mb": round(model_registry.footprint(sklearn_model) / 1e6, 3),
+            "compiled_mb": round(compiled_model.nbytes / 1e6, 3),
+            "max_abs_diff": float(np.abs(sklearn_model.predict(forecast_x) - compiled_model.predict(forecast_x)).max()),
+        }
+
+        ops = {
+            "log_pain": (lambda: handler.log_pain(str(now), 5), rows),
+            #concurrent /pain commands, coalesced by the writer into a few commits
+            "log_pain_burst": (lambda: asyncio.gather(*(
+                handler.log_pain(str(now - timedelta(hours=h)), h % 11) for h in range(BURST)
+            )), BURST),
+            "_update_features": (lambda: handler._update_features(weather, now), rows),
+            "_update_forecast_range": (lambda: handler._update_forecast_range(today, today + timedelta(days=7)), rows),
+            "model_pain": (lambda: handler.model_pain(False), rows - labeled),
+            "get_forecast": (lambda: handler.refresh_snapshot() or handler.get_forecast(), rows - labeled),
+            "preprocess": (lambda: ml.preprocess(handler.store.read(), True), rows),
+            #what the bot's training jobs get : data.db, streamed into a memory map within the budget
+            "update_model": (lambda: ml.update_model(handler.training_source(), handler.pain_model), labeled),
+            "get_stats": (lambda: ml.get_stats(handler.training_source()), labeled),
+            "load_sklearn": (lambda: joblib.load(handler.pain_model), 1),
+            "load_compiled": (lambda: compiled_forest.load(forest_path), 1),
+            "predict_sklearn": (lambda: sklearn_model.predict(forecast_x), len(forecast_x)),
+            "predict_compiled": (lambda: compiled_model.predict(forecast_x), len(forecast_x)),
+        }
+        for op in OPERATIONS:
+            if op in skip:
+                continue
+            fn, op_rows = ops[op]
+            heavy = op in ("update_model", "get_stats")
+            results[op] = await measure(fn, op_rows, 1 if heavy else repeat)
+            print(f"[{name}] {op:<24} {results[op]['wall_s']:.4f}s  peak {results[op]['peak_mb']}MB", file=sys.stderr)
+        return results
+    finally:
+        handler.store.close()
+        handler.weather_cache.close()
+        handler.jobs.shutdown()
+
+
+async def run(sizes: list, repeat: int, skip: set) -> dict:
+    runner, base_url = await stub_server.start_stub()
+    cwd = os.getcwd()
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "startup": startup_times(repeat),
+        "results": {},
+    }
+    try:
+        for name in sizes:
+            report["results"][name] = await bench_size(name, SIZES[name], base_url, repeat, skip)
+    finally:
+        os.chdir(cwd)
+        await http_client.get_client().close()
+        await runner.cleanup()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="JointBot hot path benchmarks")
+    parser.add_argument("--sizes", default="week,month,year", help=f"comma separated, any of {','.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per operation (training ops run once)")
+    parser.add_argument("--skip", default="", help=f"comma separated operations to skip, any of {','.join(OPERATIONS)}")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    sizes = [s for s in args.sizes.split(",") if s]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown size(s) {unknown}")
+    report = asyncio.run(run(sizes, args.repeat, set(filter(None, args.skip.split(",")))))
+
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(body)
+    else:
+        print(body)
@@ -0,0 +1,154 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+FORMAT_VERSION = 1
+#flat per-node arrays, every tree concatenated, child offsets are global node indices
+ARRAYS = ("feature", "threshold", "children", "missing_left", "value", "roots")
+
+
+def compiled_path(model_path: str) -> str:
+    """pain_model.pkl -> pain_model.forest (directory of .npy arrays + meta.json)"""
+    return os.path.splitext(model_path)[0] + ".forest"
+
+
+class CompiledForest:
+    """
+    A fitted RandomForestRegressor flattened into a handful of NumPy arrays.
+    - loads in milliseconds (np.load, optionally memory mapped) instead of unpickling 300 trees
+    - ~30 bytes per node instead of sklearn's node structs + value arrays
+    - predict() walks every tree at once for a whole batch, one vectorized step per depth level
+    children[2 * node] / children[2 * node + 1] are the left / right child, leaves point at
+    themselves, so after `depth` steps every (row, tree) pair sits on its leaf.
+    Matches sklearn: X is cast to float32 like sklearn does, thresholds stay float64.
+    """
+
+    def __init__(self, feature, threshold, children, missing_left, value, roots,
+                 depth: int, feature_names, source=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.depth = int(depth)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(self.feature_names_in_)
+        #hash of the pickle this was compiled from
+        self.source = source
+
+    @classmethod
+    def from_sklearn(cls, model, source=None) -> "CompiledForest":
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise ValueError("only single output forests can be compiled")
+        counts = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        left = np.concatenate([tree.children_left for tree in trees]).astype(np.int32)
+        right = np.concatenate([tree.children_right for tree in trees]).astype(np.int32)
+        nodes = np.arange(len(left), dtype=np.int32)
+        shift = np.repeat(offsets, counts).astype(np.int32)
+        leaf = left == -1
+        left = np.where(leaf, nodes, left + shift)
+        right = np.where(leaf, nodes, right + shift)
+        children = np.stack([left, right], axis=1).ravel().astype(np.int32)
+
+        feature = np.concatenate([tree.feature for tree in trees]).astype(np.int32)
+        feature[leaf] = 0
+        threshold = np.concatenate([tree.threshold for tree in trees]).astype(np.float64)
+        #sklearn >= 1.4 learns which side NaNs go to, older versions have no NaN support at all
+        missing_left = np.concatenate([
+            np.asarray(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count)), dtype=bool)
+            for tree in trees
+        ])
+        value = np.concatenate([tree.value[:, 0, 0] for tree in trees]).astype(np.float64)
+
+        feature_names = getattr(model, "feature_names_in_", None)
+        if feature_names is None:
+            feature_names = [f"x{i}" for i in range(model.n_features_in_)]
+        return cls(feature, threshold, children, missing_left, value, offsets.astype(np.int32),
+                   max(tree.max_depth for tree in trees), feature_names, source)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    def predict(self, X, chunk_rows: int = 4096) -> np.ndarray:
+        """Mean leaf value over all trees for every row of X (DataFrame in feature_names_in_ order, or array)."""
+        if hasattr(X, "columns"):
+            X = X[list(self.feature_names_in_)]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"expected {self.n_features_in_} features, got {X.shape}")
+
+        out = np.empty(len(X), dtype=np.float64)
+        #chunked so the (rows, trees) node matrix stays small on big inputs
+        for start in range(0, len(X), chunk_rows):
+            x = X[start:start + chunk_rows]
+            flat = x.ravel()
+            offsets = (np.arange(len(x)) * x.shape[1])[:, None]
+            has_nan = np.isnan(flat).any()
+            nodes = np.broadcast_to(self.roots, (len(x), self.n_trees)).copy()
+            for _ in range(self.depth):
+                values = flat[offsets + self.feature[nodes]]
+                go_right = values > self.threshold[nodes]
+                if has_nan:
+                    go_right = np.where(np.isnan(values), ~self.missing_left[nodes], go_right)
+                nodes = self.children[2 * nodes + go_right]
+            out[start:start + len(x)] = self.value[nodes].mean(axis=1)
+        return out
+
+    def save(self, path: str):
+        """Writes the arrays + meta.json into a temp directory and swaps it in place of `path`."""
+        tmp_path, old_path = path + ".tmp", path + ".old"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_path, name + ".npy"), np.ascontiguousarray(getattr(self, name)))
+        meta = {
+            "format": FORMAT_VERSION,
+            "depth": self.depth,
+            "n_trees": self.n_trees,
+            "feature_names": [str(name) for name in self.feature_names_in_],
+            "source": self.source,
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=4)
+        #memory mapped readers of the old arrays keep working, their files stay alive until unmapped
+        if os.path.isdir(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def read_meta(path: str) -> dict | None:
+    try:
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+        return None
+
+
+def load(path: str, mmap_mode="r") -> CompiledForest:
+    """Loads a saved forest, by default memory mapped (pages shared between processes, nothing copied)."""
+    meta = read_meta(path)
+    if meta is None or meta.get("format") != FORMAT_VERSION:
+        raise ValueError(f"no compiled forest at {path}")
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode) for name in ARRAYS}
+    return CompiledForest(**arrays, depth=meta["depth"], feature_names=meta["feature_names"], source=meta["source"])
+
+
+def export(model, path: str, source=None) -> CompiledForest:
+    """Compiles a fitted sklearn forest (or re-saves an already compiled one) to `path`."""
+    forest = model if isinstance(model, CompiledForest) else CompiledForest.from_sklearn(model)
+    forest.source = source
+    forest.save(path)
+    return forest
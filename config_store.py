@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import threading
+
+
+class ConfigStore:
+    """
+    config.json held in memory.
+    - reads are served from memory, the file is only re-parsed when it changed on disk
+      (edited by hand / another process)
+    - updates are merged in memory and written as one atomic write (temp file + rename),
+      optionally debounced so a burst of updates costs a single write
+    A missing or unparsable file reads as None, same as the old get_config().
+    """
+
+    def __init__(self, path="config.json", debounce: float = 0.0):
+        self.path = path
+        self.debounce = debounce
+        self._data: dict | None = None
+        self._stat = None
+        self._dirty = False
+        self._timer: threading.Timer | None = None
+        self._lock = threading.RLock()
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _reload_if_changed(self):
+        stat = self._file_stat()
+        if stat == self._stat or self._dirty:
+            return
+        self._stat = stat
+        try:
+            with open(self.path, "r") as f:
+                self._data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._data = None
+
+    def get(self) -> dict | None:
+        with self._lock:
+            self._reload_if_changed()
+            return None if self._data is None else dict(self._data)
+
+    def update(self, values: dict):
+        """Merges `values` into the config, coalesced into a single write."""
+        with self._lock:
+            self._reload_if_changed()
+            data = dict(self._data or {})
+            data.update(values)
+            self._data = data
+            self._schedule()
+
+    def replace(self, values: dict):
+        """Overwrites the whole config."""
+        with self._lock:
+            self._data = dict(values)
+            self._schedule()
+
+    def _schedule(self):
+        self._dirty = True
+        if self.debounce <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.debounce, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Writes pending changes now (temp file in the same dir + rename, never a torn file)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".config-", suffix=".json")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self._data, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._stat = self._file_stat()
+            self._dirty = False
@@ -0,0 +1,99 @@
+import asyncio
+
+import perf
+
+
+class DataWriter:
+    """
+    The only writer of a tenant's data store and of its config's previous_time.
+    Commands submit mutations (pain logs, weather upserts, prediction writes) and await
+    them; one task applies them in order, so two commands can never interleave a
+    read-modify-write. Whatever is queued when the task wakes up - plus anything arriving
+    within `coalesce_window` seconds - is applied in one store.batch(), one commit.
+    - read-your-writes : submit() returns once the batch holding the mutation is committed
+    - backpressure : the queue holds `maxsize` mutations, submit() waits while it's full
+    - a mutation that raises only fails its own submit() : its writes are rolled back to its
+      savepoint and its staged config updates dropped, the rest of the batch commits
+    The task runs while there's work and exits when the queue is drained.
+    """
+
+    def __init__(self, store, config, maxsize=256, max_batch=64, coalesce_window=0.005):
+        self.store = store
+        self.config = config
+        self.max_batch = max_batch
+        self.coalesce_window = coalesce_window
+        self._queue: asyncio.Queue | None = None
+        self._maxsize = maxsize
+        self._task: asyncio.Task | None = None
+        #config updates made by the running batch, written once it's committed
+        self._config_updates = {}
+        self.batches = 0
+        self.mutations = 0
+
+    def __len__(self):
+        return 0 if self._queue is None else self._queue.qsize()
+
+    def busy(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def submit(self, fn, *args):
+        """Queues fn(*args) - a function doing store writes - and returns its result once committed."""
+        if self._queue is None:
+            self._queue = asyncio.Queue(self._maxsize)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, args, future))
+        if not self.busy():
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    def get_config(self, key: str):
+        """Config value as the running batch sees it (its own pending updates included)."""
+        if key in self._config_updates:
+            return self._config_updates[key]
+        config = self.config.get()
+        return None if config is None else config.get(key)
+
+    def update_config(self, values: dict):
+        """Stages config updates from inside a mutation, applied after the batch commits."""
+        self._config_updates.update(values)
+
+    async def _run(self):
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait()]
+            #let the rest of a burst catch up, then take everything that's queued
+            if self.coalesce_window > 0 and len(batch) < self.max_batch:
+                await asyncio.sleep(self.coalesce_window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._apply(batch)
+
+    def _apply(self, batch: list):
+        results = []
+        self._config_updates = {}
+        try:
+            with perf.span("writer.batch"), self.store.batch():
+                for fn, args, future in batch:
+                    staged = dict(self._config_updates)
+                    try:
+                        with self.store.mutation():
+                            results.append((future, fn(*args), None))
+                    except Exception as e:
+                        self._config_updates = staged
+                        results.append((future, None, e))
+            if self._config_updates:
+                self.config.update(self._config_updates)
+        except Exception as e:
+            #the commit itself failed, nothing in the batch is in the store
+            results = [(future, None, e) for _, _, future in batch]
+        finally:
+            self._config_updates = {}
+
+        self.batches += 1
+        self.mutations += len(batch)
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,170 @@
+import hashlib
+import json
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+#bump whenever the math in this file changes, stale materialized features get rebuilt
+FEATURE_VERSION = 1
+
+#weather columns that get lag deltas / rolling means
+LAG_COLUMNS = ["pressure_msl", "relative_humidity_2m", "temperature_2m"]
+LAG_HOURS = (3, 6, 12, 24)
+ROLLING_HOURS = (6, 24)
+PRESSURE_TREND_HOURS = 14
+
+#how much history has to precede a row for all of its features to be defined
+LOOKBACK_HOURS = max(max(LAG_HOURS), max(ROLLING_HOURS), PRESSURE_TREND_HOURS + 1)
+#rebuild() recomputes the table this many hours at a time
+REBUILD_CHUNK_HOURS = 24 * 90
+
+
+def lag_delta(values: np.ndarray, hours: int) -> np.ndarray:
+    """values[t] - values[t - hours], 0 where there's not enough history."""
+    out = np.zeros(len(values), dtype=np.float32)
+    if hours < len(values):
+        out[hours:] = values[hours:] - values[:-hours]
+    return np.nan_to_num(out, nan=0.0)
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over `window` hours, 0 where the window isn't full (or hits a gap)."""
+    valid = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0), dtype=np.float64)))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    out = np.zeros(len(values), dtype=np.float32)
+    if window <= len(values):
+        window_sums = sums[window:] - sums[:-window]
+        window_counts = counts[window:] - counts[:-window]
+        out[window - 1:] = np.where(window_counts == window, window_sums / window, 0.0)
+    return out
+
+
+def calendar_features(index: pd.DatetimeIndex) -> dict:
+    return {
+        "month": index.month.to_numpy(dtype=np.int8),
+        "day": index.day.to_numpy(dtype=np.int8),
+        "hour": index.hour.to_numpy(dtype=np.int8),
+    }
+
+
+def weather_features(hourly: pd.DataFrame) -> dict:
+    """
+    Lag / rolling features over a continuous hourly frame (gaps already reindexed to NaN),
+    so every window really spans the hours it claims to.
+    """
+    out = {}
+    pressure = hourly["pressure_msl"].to_numpy(dtype=np.float64)
+    out["pressure_24hr_delta"] = lag_delta(pressure, 24)
+    out["pressure_trend"] = rolling_mean(pressure, PRESSURE_TREND_HOURS)
+    out["pressure_slope"] = rolling_mean(np.concatenate(([np.nan], np.diff(pressure))), PRESSURE_TREND_HOURS)
+
+    for col in LAG_COLUMNS:
+        values = hourly[col].to_numpy(dtype=np.float64)
+        for hours in LAG_HOURS:
+            if col == "pressure_msl" and hours == 24:
+                continue #already pressure_24hr_delta
+            out[f"{col}_delta_{hours}h"] = lag_delta(values, hours)
+        for window in ROLLING_HOURS:
+            out[f"{col}_mean_{window}h"] = rolling_mean(values, window)
+    return out
+
+
+def compute(data: pd.DataFrame) -> pd.DataFrame:
+    """Returns only the engineered feature columns for the rows of `data` (indexed by hourly time)."""
+    data = data.sort_index()
+    if data.empty:
+        return pd.DataFrame({name: pd.Series(dtype=np.float32) for name in feature_names()}, index=data.index)
+
+    full_index = pd.date_range(data.index[0], data.index[-1], freq="h")
+    hourly = data[LAG_COLUMNS].reindex(full_index)
+
+    #positions of the original rows inside the continuous series
+    positions = full_index.get_indexer(data.index)
+    engineered = {name: values[positions] for name, values in weather_features(hourly).items()}
+    engineered.update(calendar_features(data.index))
+
+    return pd.DataFrame(engineered, index=data.index)
+
+
+def build(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds every engineered feature to `data` (indexed by hourly time, as returned by the store).
+    Windows are computed over the continuous hourly series before any filtering, so the same
+    call serves training (all actuals) and inference (forecast rows + LOOKBACK_HOURS of history).
+    """
+    data = data.sort_index()
+    return data.join(compute(data))
+
+
+def has_features(data: pd.DataFrame) -> bool:
+    return set(feature_names()).issubset(data.columns)
+
+
+def feature_names() -> list:
+    """Names of the columns build() adds, in order."""
+    hourly = pd.DataFrame({col: np.zeros(1) for col in LAG_COLUMNS})
+    return list(weather_features(hourly)) + ["month", "day", "hour"]
+
+
+def typed(data: pd.DataFrame) -> pd.DataFrame:
+    """Feature columns in the dtypes build() produces (the table stores them as REAL)."""
+    names = feature_names()
+    data[names[:-3]] = data[names[:-3]].astype(np.float32)
+    data[names[-3:]] = data[names[-3:]].astype(np.int8)
+    return data
+
+
+def schema_hash() -> str:
+    """Identifies the current feature definitions, stored next to the materialized table."""
+    spec = {
+        "version": FEATURE_VERSION,
+        "lag_columns": LAG_COLUMNS,
+        "lag_hours": LAG_HOURS,
+        "rolling_hours": ROLLING_HOURS,
+        "pressure_trend_hours": PRESSURE_TREND_HOURS,
+        "names": feature_names(),
+    }
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+class FeatureStore:
+    """
+    Materialized feature table kept next to the raw hourly rows.
+    Weather upserts only recompute the windows they touch; a changed schema hash
+    (feature math / windows changed) rebuilds the whole table.
+    Pain label changes need no refresh - no feature depends on pain.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        if store.get_meta("feature_schema") != schema_hash():
+            self.rebuild()
+
+    def rebuild(self):
+        #a few months at a time (plus their lookback), memory doesn't grow with the history
+        self.store.reset_features(feature_names())
+        first, last = self.store.bounds()
+        rows = 0
+        start = first
+        while start is not None and start <= last:
+            end = start + timedelta(hours=REBUILD_CHUNK_HOURS - 1)
+            raw = self.store.read(start=start - timedelta(hours=LOOKBACK_HOURS), end=end, columns=LAG_COLUMNS)
+            chunk = compute(raw).loc[start:end]
+            self.store.upsert_features(chunk)
+            rows += len(chunk)
+            start = end + timedelta(hours=1)
+        self.store.set_meta("feature_schema", schema_hash())
+        print(f"Features rebuilt for {rows} rows")
+
+    def refresh(self, start, end):
+        """Recomputes features for every row whose windows include an hour in [start, end]."""
+        lookback = timedelta(hours=LOOKBACK_HOURS)
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        raw = self.store.read(start=start - lookback, end=end + lookback, columns=LAG_COLUMNS)
+        affected = compute(raw).loc[start:end + lookback]
+        self.store.upsert_features(affected)
+
+    def read(self, start=None, end=None, is_actual=None) -> pd.DataFrame:
+        """Raw rows with their ready-made features, in the same dtypes build() produces."""
+        return typed(self.store.read_features(start, end, is_actual))
@@ -2,8 +2,9 @@ import datetime
 import pytz
 from dotenv import load_dotenv, set_key
 import os
-import requests
-import json
+
+import http_client
+from config_store import ConfigStore
 
 def get_time(timezone) : 
     tz = pytz.timezone(timezone)
@@ -25,12 +26,18 @@ def country_check(country) :
     else :
         return False
 
-#API call to get location information
-def get_location(zipOrCity, country) : 
+#API call to get location information (non-blocking, goes through the shared pooled client)
+async def get_location(zipOrCity, country, url=http_client.GEOCODING_URL) : 
     check = country_check(country)
 
-    response = requests.get(f"https://geocoding-api.open-meteo.com/v1/search?name={zipOrCity}&count=1&language=en&format=json&countryCode={country}")
-    data = response.json()
+    params = {
+        "name" : zipOrCity,
+        "count" : 1,
+        "language" : "en",
+        "format" : "json",
+        "countryCode" : country
+    }
+    data = await http_client.get_client().get_json(url, params=params)
 
     if 'results' not in data or check is False :
         return None
@@ -50,22 +57,24 @@ def get_location(zipOrCity, country) :
         
         return output
 
+#config.json lives in memory, see config_store.py
+_config = ConfigStore("config.json")
+
 def add_config(info) :
-    json_object = json.dumps(info, indent=4)
-    with open("config.json", "w") as f :
-        f.write(json_object)
+    _config.replace(info)
 
 def append_config(key,value) :
-    with open("config.json", "r") as f:
-        data = json.load(f)
-        data[key] = value
-    with open("config.json", "w") as ff :
-        json.dump(data, ff, indent=4)
+    _config.update({key : value})
+
+def update_config(values) :
+    #several keys, one write
+    _config.update(values)
+
+def flush_config() :
+    _config.flush()
 
 def get_config() :
-    try: 
-        with open("config.json", "r") as f :
-            json_object = json.load(f)
-            return json_object
-    except json.JSONDecodeError:
-        return None
\ No newline at end of file
+    return _config.get()
+
+def default_config() :
+    return _config
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import random
+import aiohttp
+from urllib.parse import urlparse
+
+import perf
+
+#overridable so the bot can be pointed at a local stub server (see stub_server.py)
+FORECAST_URL = os.getenv("OPEN_METEO_FORECAST_URL", "https://api.open-meteo.com/v1/forecast")
+GEOCODING_URL = os.getenv("OPEN_METEO_GEOCODING_URL", "https://geocoding-api.open-meteo.com/v1/search")
+ARCHIVE_URL = os.getenv("OPEN_METEO_ARCHIVE_URL", "https://archive-api.open-meteo.com/v1/archive")
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HttpClient:
+    """
+    Shared asyncio HTTP client for Open-Meteo calls.
+    One keep-alive connection pool, per-request timeouts, bounded retries with
+    exponential backoff and a cap on in-flight requests, so a slow upstream
+    never blocks the Discord event loop.
+    """
+
+    def __init__(self, max_connections=8, max_concurrency=4, timeout=10.0, retries=3, backoff=0.5):
+        self.max_connections = max_connections
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self._limit = asyncio.Semaphore(max_concurrency)
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        #created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def get_json(self, url: str, params: dict | None = None):
+        """GETs `url` and returns the decoded JSON body, retrying transient failures."""
+        session = self._get_session()
+        name = f"http.{urlparse(url).netloc}{urlparse(url).path}"
+        with perf.span(name):
+            return await self._get_json(session, url, params)
+
+    async def _get_json(self, session, url, params):
+        attempt = 0
+        while True:
+            try:
+                async with self._limit:
+                    async with session.get(url, params=params) as response:
+                        if response.status in RETRY_STATUS and attempt < self.retries:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status
+                            )
+                        response.raise_for_status()
+                        return await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUS
+                if attempt >= self.retries or not retryable:
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                attempt += 1
+                print(f"HTTP retry {attempt}/{self.retries} for {url} in {delay:.1f}s : {e}")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+_client: HttpClient | None = None
+
+def get_client() -> HttpClient:
+    """Returns the process-wide shared client."""
+    global _client
+    if _client is None:
+        _client = HttpClient()
+    return _client
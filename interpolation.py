@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+STRATEGIES = ("linear", "step", "decay")
+
+
+def fill(prev_pain: float, curr_pain: float, hours: int, strategy: str = "linear",
+         baseline: float = 0.0, half_life: float = 6.0) -> np.ndarray:
+    """
+    Pain values for the hours [0, hours] between two logs (both ends included).
+    - linear : straight line from prev_pain to curr_pain
+    - step   : prev_pain is held until the new log
+    - decay  : prev_pain decays exponentially toward `baseline` (half-life in hours)
+    The last value is always curr_pain. Values are rounded to 1 decimal like the logs.
+    """
+    if strategy == "linear":
+        values = np.linspace(prev_pain, curr_pain, hours + 1)
+    elif strategy == "step":
+        values = np.full(hours + 1, prev_pain, dtype=np.float64)
+    elif strategy == "decay":
+        t = np.arange(hours + 1, dtype=np.float64)
+        values = baseline + (prev_pain - baseline) * np.power(0.5, t / half_life)
+    else:
+        raise ValueError(f"Unknown interpolation strategy '{strategy}', expected one of {STRATEGIES}")
+    values[-1] = curr_pain
+    return np.round(values, 1)
+
+
+def segments(entries, prev=None, strategy="linear", max_gap_hours=None, **kwargs):
+    """
+    Turns a batch of pain logs into (times, values) covering every hour that needs writing.
+    - entries       : iterable of (timestamp, pain_level), any order, already rounded to the hour
+    - prev          : optional (timestamp, pain_level) the first entry continues from
+    - max_gap_hours : gaps longer than this aren't interpolated; the previous value is held
+                      to the end of its day and the new log is written on its own
+    Later segments overwrite the shared endpoint of earlier ones.
+    """
+    entries = sorted((pd.Timestamp(ts), float(pain)) for ts, pain in entries)
+    if prev is not None and prev[0] is not None and pd.Timestamp(prev[0]) < entries[0][0]:
+        chain = [(pd.Timestamp(prev[0]), float(prev[1]))] + entries
+    else:
+        chain = entries
+
+    times = [pd.DatetimeIndex([chain[0][0]])]
+    values = [np.array([chain[0][1]])]
+    for (t0, p0), (t1, p1) in zip(chain, chain[1:]):
+        hours = int((t1 - t0) / pd.Timedelta(hours=1))
+        if hours <= 0:
+            times.append(pd.DatetimeIndex([t1]))
+            values.append(np.array([p1]))
+        elif max_gap_hours is not None and hours > max_gap_hours:
+            eod = t0.normalize() + pd.Timedelta(hours=23)
+            held = pd.date_range(t0, eod, freq="h")
+            times += [held, pd.DatetimeIndex([t1])]
+            values += [np.full(len(held), p0), np.array([p1])]
+        else:
+            times.append(pd.date_range(t0, periods=hours + 1, freq="h"))
+            values.append(fill(p0, p1, hours, strategy, **kwargs))
+
+    times = times[0].append(times[1:])
+    values = np.concatenate(values)
+    #keep the last write for each hour
+    keep = ~times.duplicated(keep="last")
+    return times[keep], values[keep]
@@ -0,0 +1,66 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import perf
+
+
+class JobRunner:
+    """
+    Runs CPU-heavy work (model training / evaluation) in a process pool so the
+    Discord event loop keeps serving heartbeats and other commands.
+    Jobs are keyed ("kind:tenant") - submitting a key that's already running joins
+    the existing job instead of starting a duplicate.
+    A pool whose worker died (e.g. OOM killed mid fit) is broken for good : the jobs it was
+    running fail, the next submit starts a fresh pool.
+    """
+
+    def __init__(self, max_workers=1):
+        #1 worker by default, the forests already fit with n_jobs=-1 across all cores
+        self.max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+        self._running: dict[str, asyncio.Future] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def is_running(self, key: str) -> bool:
+        return key in self._running
+
+    async def run(self, key: str, fn, *args):
+        """Runs fn(*args) in the pool (or joins the running job with the same key) and awaits the result."""
+        future = self._running.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                future = loop.run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                self._discard(executor)
+                executor = self._get_executor()
+                future = loop.run_in_executor(executor, fn, *args)
+            self._running[key] = future
+            started = time.perf_counter()
+            def done(_) :
+                self._running.pop(key, None)
+                if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                    print(f"Job pool broken ({key}), a new one is started for the next job")
+                    self._discard(executor)
+                #fit / evaluate time as seen from the bot, the work itself happens in the worker
+                perf.record(f"job.{key.split(':')[0]}", time.perf_counter() - started)
+            future.add_done_callback(done)
+        #shield so a cancelled waiter doesn't cancel the job for everyone else
+        return await asyncio.shield(future)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
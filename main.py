@@ -1,16 +1,44 @@
+import time
+#startup budget is measured from here
+started = time.perf_counter()
+
 import discord
 from discord.ext import commands
 from discord import app_commands
 import logging
 import asyncio
+import functools
+from datetime import timedelta
+import hashlib
+import io
+import json
+import os
 
 import helper_funcs
-import WeatherHandler
+import perf
+import reminders
+import scheduler
+import tenants
+
+#pandas / scikit-learn aren't imported above - they load in the background once connected
+imported = time.perf_counter() - started
+perf.record("startup.imports", imported)
+#seconds from launch until the bot starts logging in, a warning is printed when exceeded
+STARTUP_BUDGET = float(os.getenv('JOINTBOT_STARTUP_BUDGET', '1.0'))
+#JOINTBOT_PREWARM=0 skips the background import, the first command then pays for it
+PREWARM = os.getenv('JOINTBOT_PREWARM', '1') != '0'
+#how long a command waits for startup before telling the user to retry
+READY_WAIT = 2.0
 
 #init objects + grab .env variables
 token, guild = helper_funcs.load_env()
 guild_id=discord.Object(id=guild)
-weatherBot=WeatherHandler.WeatherHandler()
+#one data partition (location, data store, model) per user - or per guild with JOINTBOT_TENANCY=guild
+users=tenants.TenantManager(
+    mode=os.getenv('JOINTBOT_TENANCY', 'user'),
+    legacy_owner=os.getenv('JOINTBOT_LEGACY_OWNER'),
+)
+refresher=scheduler.RefreshScheduler(users)
 
 #set logging and intents (permissions)
 handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
@@ -19,7 +47,6 @@ intents.message_content=True
 intents.members=True
 
 bot = commands.Bot(command_prefix='!', intents=intents)
-followup_task: asyncio.Task | None = None
 emojis = ["0️⃣", "1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
 
 
@@ -32,44 +59,138 @@ class PainLevelSelect(discord.ui.Select):
         super().__init__(placeholder="Updated Pain (0-10)", min_values=1, max_values=1, options=options, custom_id="string_select")
 
     async def callback(self, interaction: discord.Interaction) :
-        updated_pain = self.values[0]
-        await handle_pain(interaction, int(updated_pain))
-        await interaction.message.delete()
+        await select_pain(interaction, int(self.values[0]))
 
 class PainLevelView(discord.ui.View) :
-    def __init__(self,timeout=1) : 
-        super().__init__()
+    def __init__(self) : 
+        #persistent (no timeout, fixed custom_id), follow-ups stay answerable after a restart
+        super().__init__(timeout=None)
         self.add_item(PainLevelSelect())
 
+async def deliver_followup(reminder) :
+    """Sends a due follow-up by channel id (DMs / deleted channels fall back to the user)."""
+    channel = None
+    if reminder.channel_id is not None :
+        channel = bot.get_channel(reminder.channel_id)
+        if channel is None :
+            try :
+                channel = await bot.fetch_channel(reminder.channel_id)
+            except (discord.NotFound, discord.Forbidden) :
+                channel = None
+    if channel is None :
+        channel = await bot.fetch_user(reminder.user_id)
+    await channel.send(reminder.message, view=PainLevelView())
+
+#pending follow-ups for every user, one timer task, kept in users/reminders.db across restarts
+followups=reminders.ReminderScheduler(reminders.ReminderStore(os.path.join(users.root, "reminders.db")), deliver_followup)
+#set once the data / model stack is loaded, commands that need it wait on it (see gated)
+ready = asyncio.Event()
+startup_task: asyncio.Task | None = None
+
+def gated(fn) :
+    """
+    Command waits up to READY_WAIT for startup and for the user's data to be opened (built in
+    a thread, see tenants.py), then asks the user to retry instead of blocking.
+    """
+    @functools.wraps(fn)
+    async def wrapper(interaction: discord.Interaction, *args, **kwargs) :
+        if not ready.is_set() :
+            try :
+                await asyncio.wait_for(ready.wait(), READY_WAIT)
+            except asyncio.TimeoutError :
+                await interaction.response.send_message("⏳ - JointBot is still starting up, try again in a few seconds", ephemeral=True)
+                return
+        try :
+            #keeps loading in the background after a timeout, the retry finds it open
+            await asyncio.wait_for(users.open(users.key_for(interaction)), READY_WAIT)
+        except asyncio.TimeoutError :
+            await interaction.response.send_message("⏳ - Loading your data, try again in a few seconds", ephemeral=True)
+            return
+        return await fn(interaction, *args, **kwargs)
+    return wrapper
+
+def command_hash() -> str :
+    tree = bot.tree
+    try :
+        payload = [command.to_dict(tree) for command in tree.get_commands(guild=guild_id)]
+    except TypeError :
+        #discord.py < 2.4
+        payload = [command.to_dict() for command in tree.get_commands(guild=guild_id)]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+async def sync_commands() :
+    """Syncs slash commands only when their definitions changed since the last sync."""
+    path = os.path.join(users.root, "command_hash")
+    current = command_hash()
+    try :
+        with open(path, "r") as f :
+            if f.read().strip() == current :
+                print("Commands unchanged, sync skipped")
+                return
+    except FileNotFoundError :
+        pass
+    await bot.tree.sync(guild=guild_id)
+    with open(path, "w") as f :
+        f.write(current)
+    print("Commands synced")
+
+async def startup() :
+    if PREWARM :
+        #in a thread - the bot keeps answering (and gated commands keep waiting) meanwhile
+        await asyncio.to_thread(users.prewarm)
+    ready.set()
+    loaded = time.perf_counter() - started
+    perf.record("startup.ready", loaded)
+    print(f"Startup : imports {imported:.2f}s, ready {loaded:.2f}s")
+    #hourly / midnight data refresh runs in the background from here on
+    refresher.start()
+    try :
+        await sync_commands()
+    except Exception as e :
+        print(f"Command sync failed : {e}")
+
 @bot.event
 async def on_ready(): 
-    await bot.tree.sync(guild=guild_id)
-    print(f"{bot.user.name} LOADED")
+    global startup_task
+    connected = time.perf_counter() - started
+    perf.record("startup.connected", connected)
+    bot.add_view(PainLevelView())
+    #catches up on follow-ups that came due while the bot was down
+    followups.start()
+    #on_ready fires again on reconnects, start up once
+    if startup_task is None :
+        startup_task = asyncio.create_task(startup())
+    print(f"{bot.user.name} LOADED in {connected:.2f}s")
 
 @bot.tree.command(name="local", description="Set location parameters", guild=guild_id)
 @app_commands.describe(zip_or_city="Zipcode / City to use for joint and weather forecasts", country = "Country to use for joint and weather forecasts")
+@perf.timed("command.local")
+@gated
 async def local (interaction: discord.Interaction, zip_or_city: str, country: str) :
     if len(country) != 2 :
         await interaction.response.send_message("❌ - Invalid country code, provide 2 letter country code")
         return
     
-    check = helper_funcs.get_location(zip_or_city.upper(), country.upper()) 
+    check = await helper_funcs.get_location(zip_or_city.upper(), country.upper()) 
 
     if check is None :
         await interaction.response.send_message("❌ - Invalid zipcode or city provided, try again")
     elif check != None :
-        for key,value in check.items() :
-            helper_funcs.append_config(key,value)
+        weatherBot = await users.for_interaction(interaction)
+        weatherBot.config.update(check)
         local_zipOrCity = check['zipOrCity']
         local_country = check['country']
         await interaction.response.send_message(f"✅ - Zipcode / City has changed to {local_zipOrCity}, {local_country} by {interaction.user.mention}")
+        #first location for this user - pull their initial week of weather
+        await weatherBot.setup()
     else :
         await interaction.response.send_message(f"❌ - Zipcode / City error, try again")
 
     
 @bot.tree.command(name="location", guild=guild_id) 
+@perf.timed("command.location")
 async def location (interaction: discord.Interaction) :
-    info = helper_funcs.get_config()
+    info = users.config(users.key_for(interaction))
     if info is None :
         await interaction.response.send_message("Use '/local' to set location information first")
     else :
@@ -96,62 +217,203 @@ async def send_followup(interaction, painlevel) :
     else : #painlevel == low -> no followup
         return
 
+    #replaces this user's pending follow-up, if any
+    followups.schedule(
+        interaction.user.id, interaction.channel_id, hours * 60 * 60,
+        f"👩🏻‍⚕️ - How are you feeling now? 🤒 {interaction.user.mention}",
+    )
     await interaction.followup.send(f"✅ - Follow up will be sent in {hours} hours", ephemeral=True)
-    await asyncio.sleep(hours * 60 * 60) #actual wait time
-
-    await interaction.followup.send(f"👩🏻‍⚕️ - How are you feeling now? 🤒 {interaction.user.mention}", view=PainLevelView()) 
 
 
 @bot.tree.command(name="pain", description="Level of joint pain", guild=guild_id)
 @app_commands.describe(pain_level="Rate pain level from 1-10")
+@perf.timed("command.pain")
+@gated
 async def pain (interaction: discord.Interaction, pain_level: int) : 
     await handle_pain(interaction, pain_level)
 
 
 @bot.tree.command(name="updatemodel", description="Update model - consider doing when R2 and MSE look good.", guild=guild_id)
+@perf.timed("command.updatemodel")
+@gated
 async def update_model(interaction: discord.Interaction) :
-    before = get_forecast()
-    weatherBot.update_model()
-    after = get_forecast()
-    await interaction.response.send_message(f"\n**__BEFORE__** :{before}**__AFTER__** :{after}")
+    #training takes longer than discord's 3s deadline, ack now and report back as followups
+    await interaction.response.defer(thinking=True)
+    weatherBot = await users.for_interaction(interaction)
+    if weatherBot.training() :
+        await interaction.followup.send("⏳ - Model training already in progress, waiting for it to finish", ephemeral=True)
+    else :
+        await interaction.followup.send("⏳ - Model training started", ephemeral=True)
+
+    before = get_forecast(weatherBot)
+    try :
+        await weatherBot.update_model()
+    except Exception as e :
+        await interaction.followup.send(f"❌ - Model training failed : {e}")
+        return
+    after = get_forecast(weatherBot)
+    await interaction.followup.send(f"\n**__BEFORE__** :{before}**__AFTER__** :{after}")
 
 
-@bot.tree.command(name="stats", description="Testing stats for current actuals", guild=guild_id)
+@bot.tree.command(name="backfill", description="Load past weather for your location, to train on older pain data", guild=guild_id)
+@app_commands.describe(days="Days of history to load, counting back from yesterday (default 365)")
+@perf.timed("command.backfill")
+@gated
+async def backfill(interaction: discord.Interaction, days: app_commands.Range[int, 1, 3650] = 365) :
+    weatherBot = await users.for_interaction(interaction)
+    if weatherBot.config.get() is None :
+        await interaction.response.send_message("Use '/local' to set location information first")
+        return
+    await interaction.response.defer(thinking=True)
+    #same range on every retry, so chunks loaded by an earlier run are skipped
+    end = weatherBot.local_now() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    try :
+        report = await weatherBot.backfill_weather(start.date(), end.date())
+    except Exception as e :
+        await interaction.followup.send(f"❌ - Backfill failed : {e}")
+        return
+    msg = f"✅ - {report['rows']} hours of weather loaded from {start.date()} to {end.date()}"
+    if report['skipped'] :
+        msg += f" ({report['skipped']} of {report['chunks']} chunks were already loaded)"
+    if report['failed'] :
+        msg += f"\n⚠️ - {report['failed']} chunk(s) failed, run /backfill again to retry them"
+    if report['rows'] :
+        msg += "\nThese hours are used for training once '/importpain' (or '/pain') covers them"
+    await interaction.followup.send(msg)
+
+
+@bot.tree.command(name="importpain", description="Import a pain diary CSV (time, pain_level)", guild=guild_id)
+@app_commands.describe(diary="CSV with a time and a pain_level column")
+@perf.timed("command.importpain")
+@gated
+async def importpain(interaction: discord.Interaction, diary: discord.Attachment) :
+    weatherBot = await users.for_interaction(interaction)
+    await interaction.response.defer(thinking=True)
+    try :
+        report = await weatherBot.import_pain(io.BytesIO(await diary.read()))
+    except Exception as e :
+        await interaction.followup.send(f"❌ - Import failed : {e}")
+        return
+    msg = f"✅ - {report['entries']} pain logs imported"
+    if report['outside'] :
+        msg += f"\n⚠️ - {report['outside']} of them are outside your stored weather, use /backfill first and import again"
+    await interaction.followup.send(msg)
+
+
+@bot.tree.command(name="tune", description="Search for a smaller / faster model that's as accurate (used by the next /updatemodel)", guild=guild_id)
+@app_commands.describe(budget="Time budget in seconds (default 300)")
+@perf.timed("command.tune")
+@gated
+async def tune(interaction: discord.Interaction, budget: app_commands.Range[int, 30, 3600] = 300) :
+    await interaction.response.defer(thinking=True)
+    try :
+        weatherBot = await users.for_interaction(interaction)
+        report = await weatherBot.tune_model(budget)
+    except Exception as e :
+        await interaction.followup.send(f"❌ - Tuning failed : {e}")
+        return
+    msg = f"✅ - Tuned in {report['time_s']:.0f}s ({report['evaluated']} evaluations)\n```\n"
+    for name, result in (('chosen', report['best']), ('previous', report['baseline'])) :
+        if result is None :
+            msg += f"{name} : eliminated early\n"
+            continue
+        config = ", ".join(f"{k}={v}" for k, v in result['config'].items() if k != 'random_state')
+        msg += f"{name} : {config}\n  MSE {result['mse']:.3f} | {result['latency_ms']}ms | {result['size_mb']}MB\n"
+    msg += "```Run /updatemodel to train with the chosen config"
+    await interaction.followup.send(msg)
+
+
+@bot.tree.command(name="stats", description="Walk-forward cross-validated stats for current actuals", guild=guild_id)
+@perf.timed("command.stats")
+@gated
 async def stats (interaction: discord.Interaction) :
-    stats = weatherBot.see_stats()
+    await interaction.response.defer(thinking=True)
+    try :
+        weatherBot = await users.for_interaction(interaction)
+        stats = await weatherBot.see_stats()
+    except Exception as e :
+        await interaction.followup.send(f"❌ - Stats failed : {e}")
+        return
     msg = "\n```\n"
     for key,value in stats.items() : 
+        if key != 'folds' :
+            msg += f"{key} : {value}\n"
+    #walk-forward folds, oldest test block first
+    msg += "\nfold  train   test    R2      MSE    fit(s)\n"
+    for fold in stats['folds'] :
+        msg += f"{fold['fold']:<5} {fold['train_rows']:<7} {fold['test_rows']:<6} {fold['R2']:<7.3f} {fold['MSE']:<6.3f} {fold['fit_s']}\n"
+    msg += "```"
+    await interaction.followup.send(msg)
+
+@bot.tree.command(name="model", description="Current model version, load time, memory footprint and last update / drift", guild=guild_id)
+@perf.timed("command.model")
+@gated
+async def model (interaction: discord.Interaction) :
+    weatherBot = await users.for_interaction(interaction)
+    info = weatherBot.model_stats()
+    msg = "\n```\n"
+    for key,value in info.items() : 
         msg += f"{key} : {value}\n"
     msg += "```"
     await interaction.response.send_message(msg)
 
-def get_forecast() : 
+
+@bot.tree.command(name="rollback", description="Roll back to the previous model version", guild=guild_id)
+@perf.timed("command.rollback")
+@gated
+async def rollback (interaction: discord.Interaction) :
+    weatherBot = await users.for_interaction(interaction)
+    #the restored version is recompiled from its pickle, can take longer than discord's 3s deadline
+    await interaction.response.defer(thinking=True)
+    if await weatherBot.rollback_model() :
+        await interaction.followup.send(f"✅ - Model rolled back to {weatherBot.models.version}")
+    else :
+        await interaction.followup.send("❌ - No previous model version to roll back to")
+
+@bot.tree.command(name="perf", description="Latency percentiles and call counts since startup", guild=guild_id)
+@perf.timed("command.perf")
+async def perf_stats (interaction: discord.Interaction) :
+    perf.dump()
+    await interaction.response.send_message(f"```\n{perf.render_text()}\n```", ephemeral=True)
+
+def get_forecast(weatherBot) : 
     forecast = weatherBot.get_forecast()
     msg = "\n**Pain Forecast - Next Week:**\n```"    
     for date, maxpain in forecast.items() :
         msg += f"{date} : {emojis[maxpain]}\n"
     msg += "```"
+    #when the weather was last refreshed, not when the snapshot was built
+    last = weatherBot.last_refresh()
+    refreshed = "never" if last is None else f"{last:%Y-%m-%d %H:%M}"
+    msg += f"Last refreshed: {refreshed}\n"
     return msg
 
 @bot.tree.command(name="forecast", description="Displays next week's max forecasted pain level", guild=guild_id)
+@perf.timed("command.forecast")
+@gated
 async def forecast (interaction: discord.Interaction) : 
-    msg = str(get_forecast())
+    msg = str(get_forecast(await users.for_interaction(interaction)))
     await interaction.response.send_message(msg)
 
+@gated
+async def select_pain(interaction: discord.Interaction, pain_level: int) :
+    """Answer to a follow-up's pain select, the follow-up is removed once it's recorded."""
+    await handle_pain(interaction, pain_level)
+    await interaction.message.delete()
+
 async def handle_pain(interaction: discord.Interaction, pain_level: int) : 
-    info = helper_funcs.get_config()
+    weatherBot = await users.for_interaction(interaction)
+    info = weatherBot.config.get()
     if info is None :
         await interaction.response.send_message("Use '/local' to set location information first")
     else :
         if pain_level < 0 or pain_level > 10 :
             await interaction.response.send_message("❌ - Invalid pain level, try again.")
         else :
-            global followup_task
-            if followup_task and not followup_task.done() : 
-                followup_task.cancel()
-                
+            followups.cancel(interaction.user.id)
             
-            timezone = helper_funcs.get_config()['timezone']
+            timezone = info['timezone']
             now = helper_funcs.get_time(timezone)
             date = now.date()
             hour = now.hour
@@ -159,8 +421,10 @@ async def handle_pain(interaction: discord.Interaction, pain_level: int) :
             pain_log = str(date)+"T"+str(hour)+":"+str(minute)+":00"
             await interaction.response.send_message(f"🤕 - Pain level of {emojis[pain_level]} recorded at {str(date)} {str(hour)}:{str(minute)} by {interaction.user.mention}")
             
-            weatherBot.log_pain(pain_log, pain_level)
-            followup_task = asyncio.create_task(send_followup(interaction, pain_level))
+            await weatherBot.log_pain(pain_log, pain_level)
+            await send_followup(interaction, pain_level)
 
 
+if imported > STARTUP_BUDGET :
+    print(f"Startup budget exceeded : imports took {imported:.2f}s (budget {STARTUP_BUDGET}s)")
 bot.run(token,log_handler=handler, log_level=logging.DEBUG)
\ No newline at end of file
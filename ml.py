@@ -1,21 +1,84 @@
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import TimeSeriesSplit
 from sklearn.metrics import mean_squared_error, r2_score
+from joblib import Parallel, delayed
 import pandas as pd 
+import numpy as np
+import hashlib
 import joblib
+import json
+import os
+import time
+from contextlib import contextmanager
 
-def preprocess(data_file, is_actual:bool) : 
-    data = pd.read_csv(data_file)
-    data = data[data['is_actual'] == is_actual]
+import compiled_forest
+import features
+import training_data
+from config_store import ConfigStore
+from model_registry import file_hash
 
-    data['month'] = data.apply(lambda row: row.time[5:7], axis=1)
-    data['day'] = data.apply(lambda row: row.time[8:10], axis=1)
-    data['hour'] = data.apply(lambda row: row.time[11:13], axis=1)
-    data['pressure_24hr_delta'] = data['pressure_msl'].diff(24).fillna(0)
-    data['pressure_trend'] = data['pressure_msl'].rolling(window=14).mean().fillna(0)
-    data['pressure_slope'] = data['pressure_msl'].diff().rolling(14).mean().fillna(0)
+#forest used by update_model and evaluated by get_stats
+MODEL_CONFIG = {'n_estimators' : 300, 'max_depth' : 15, 'random_state' : 42}
+CV_SPLITS = 5
+#bump when the evaluation itself changes, invalidates cached stats
+CV_VERSION = 1
+#incremental updates : new labeled hours needed to trigger one, and how many in a row before a full rebuild
+INCREMENTAL_MIN_HOURS = 24
+FULL_REBUILD_EVERY = 7
+#new trees are fitted on the new hours plus this many times as much recent history (at least a week)
+RECENT_CONTEXT = 4
 
-    return data
+def make_model(config=None, n_jobs=-1) :
+    return RandomForestRegressor(**(config or MODEL_CONFIG), n_jobs=n_jobs)
+
+def model_config_path(model_name) :
+    return os.path.join(os.path.dirname(model_name), 'model_config.json')
+
+def fit(model, x, y) :
+    """
+    model.fit(x, y) on x's float32 values, without a copy. pandas only hands out read-only
+    views and sklearn's missing value check raises on a read-only float32 array with NaN
+    in it (backfilled hours have some) - the view is made writable, it's only read.
+    """
+    values = x.to_numpy(dtype=np.float32)
+    if not values.flags.writeable :
+        try :
+            values.flags.writeable = True
+        except ValueError :
+            values = values.copy()
+    model.fit(values, y.to_numpy())
+    model.feature_names_in_ = np.asarray(x.columns, dtype=object)
+    return model
+
+def load_model_config(model_name) -> dict :
+    """Tuned forest config saved next to the model (see tuning.py), MODEL_CONFIG if never tuned."""
+    record = ConfigStore(model_config_path(model_name)).get()
+    if not record or 'config' not in record :
+        return dict(MODEL_CONFIG)
+    return record['config']
+
+def save_model_config(model_name, record:dict) :
+    ConfigStore(model_config_path(model_name)).replace(record)
+
+def preprocess(data, is_actual:bool) : 
+    #data = frame indexed by time, as returned by the data store / feature store
+    #features are derived over the continuous hourly series first, then filtered
+    if not features.has_features(data) :
+        data = features.build(data)
+    return data[data['is_actual'] == is_actual].copy()
+
+@contextmanager
+def labeled(data) :
+    """
+    (x, y) of the labeled hours sorted by time. data = labeled feature frame, or a
+    training_data.Source - streamed into a memory map, at most its memory budget's worth of rows.
+    """
+    if isinstance(data, training_data.Source) :
+        with training_data.open_source(data) as (x, y) :
+            yield x, y
+        return
+    processed_data = preprocess(data, True).sort_index()
+    yield get_features(processed_data), get_labels(processed_data)
 
 def get_labels(data) : 
     y = data['pain_level']
@@ -28,23 +91,16 @@ def get_features(data) :
     features = [col for col in columns if col not in remove]
 
     x = data[features]
+    #categorical codes (weather_code) go into the forest as their numeric values
+    categorical = [col for col in features if isinstance(x[col].dtype, pd.CategoricalDtype)]
+    if categorical :
+        x = x.astype({col : 'float32' for col in categorical})
 
     return x
 
-def trainmodel(data) : 
-    x = get_features(data)
-    y = get_labels(data)
-   
-    x_train, x_test, y_train, y_test = train_test_split(
-        x, y, test_size=0.2, random_state=42
-    )
-
-    model = RandomForestRegressor(n_estimators=300, max_depth=15, random_state=42)
-    model.fit(x_train, y_train)
-    return x_test, y_test, model
-
-def testmodel(x_test, y_test, model) : 
-    y_pred = model.predict(x_test)
+def testmodel(x_test, y_test, model=None, y_pred=None) : 
+    if y_pred is None :
+        y_pred = model.predict(x_test)
 
     min_diff = 10
     max_diff = -10
@@ -67,16 +123,164 @@ def testmodel(x_test, y_test, model) :
     }
     return stats
 
-def get_stats(data) : 
-    processed_data = preprocess(data, True)
-    x_test, y_test, model = trainmodel(processed_data) 
-    stats = testmodel(x_test, y_test, model)
+def evaluation_key(data, config=None, n_splits=CV_SPLITS, archive=None) -> str :
+    """
+    Hash of the labeled data (a frame, or its chunks in order) + model config, cached
+    stats stay valid while it matches. Chunks hash the same as the frame they add up to.
+    archive = training_data.archive_signature() of archived hours the evaluation also reads.
+    """
+    sha = hashlib.sha1()
+    columns = []
+    for chunk in ([data] if isinstance(data, pd.DataFrame) else data) :
+        #predicted_pain isn't an input or a label, a re-prediction doesn't invalidate anything
+        chunk = chunk.drop(columns=['predicted_pain'], errors='ignore')
+        sha.update(pd.util.hash_pandas_object(chunk, index=True).values.tobytes())
+        columns = chunk.columns
+    sha.update(",".join(map(str, columns)).encode())
+    sha.update(json.dumps([config or MODEL_CONFIG, n_splits, CV_VERSION], sort_keys=True).encode())
+    if archive :
+        sha.update(json.dumps(archive).encode())
+    return sha.hexdigest()[:16]
+
+def fit_fold(x, y, train_idx, test_idx, config) :
+    #one core per fold, the folds themselves run in parallel
+    model = make_model(config, n_jobs=1)
+    #walk-forward folds are contiguous, slices are views (no copy of a memory mapped x)
+    train, test = slice(train_idx[0], train_idx[-1] + 1), slice(test_idx[0], test_idx[-1] + 1)
+    start = time.perf_counter()
+    fit(model, x.iloc[train], y.iloc[train])
+    fit_s = time.perf_counter() - start
+    start = time.perf_counter()
+    y_pred = model.predict(x.iloc[test])
+    return y_pred, fit_s, time.perf_counter() - start
+
+def cross_validate(data, config=None, n_splits=CV_SPLITS, n_jobs=-1) : 
+    """
+    Walk-forward CV : fold k trains on every labeled hour before its test block, so
+    no future hours leak into training. Folds are fitted in parallel (threads, the tree
+    fitting releases the GIL). Summary metrics are over all out-of-fold predictions.
+    """
+    data = data.sort_index()
+    return walk_forward(get_features(data), get_labels(data), config, n_splits, n_jobs)
+
+def walk_forward(x, y, config=None, n_splits=CV_SPLITS, n_jobs=-1) :
+    """cross_validate() on ready (x, y), sorted by time."""
+    start = time.perf_counter()
+    if len(x) <= n_splits : 
+        raise ValueError(f"Not enough labeled hours to evaluate ({len(x)})")
+
+    splits = list(TimeSeriesSplit(n_splits=n_splits).split(x))
+    results = Parallel(n_jobs=n_jobs, prefer="threads")(
+        delayed(fit_fold)(x, y, train_idx, test_idx, config) for train_idx, test_idx in splits
+    )
+
+    folds = []
+    for k, ((train_idx, test_idx), (y_pred, fit_s, predict_s)) in enumerate(zip(splits, results)) :
+        fold = testmodel(None, y.iloc[test_idx], y_pred=y_pred)
+        fold.update({
+            'fold' : k + 1,
+            'train_rows' : len(train_idx),
+            'test_rows' : len(test_idx),
+            'test_from' : str(x.index[test_idx[0]]),
+            'fit_s' : round(fit_s, 3),
+            'predict_s' : round(predict_s, 3),
+        })
+        folds.append(fold)
+
+    test_idx = np.concatenate([test_idx for _, test_idx in splits])
+    stats = testmodel(None, y.iloc[test_idx], y_pred=np.concatenate([r[0] for r in results]))
+    stats['folds'] = folds
+    stats['time_s'] = round(time.perf_counter() - start, 3)
     return stats
 
-def update_model(data, model_name) : 
-    processed_data = preprocess(data, True)
-    x = get_features(processed_data)
-    y = get_labels(processed_data)
-    model = RandomForestRegressor(n_estimators=300, max_depth=15, random_state=42)
-    model.fit(x, y)
-    joblib.dump(model, model_name)
\ No newline at end of file
+def get_stats(data, config=None) : 
+    with labeled(data) as (x, y) :
+        return walk_forward(x, y, config)
+
+def save_model(model, model_name) :
+    #write next to the live model then rename, readers never see a half-written file
+    tmp_name = model_name + ".tmp"
+    joblib.dump(model, tmp_name)
+    #array form for fast loads / predictions, tagged with the pickle it came from
+    compiled_forest.export(model, compiled_forest.compiled_path(model_name), source=file_hash(tmp_name))
+    os.replace(tmp_name, model_name)
+
+def load_forest(model_name) :
+    """The trained sklearn forest, None if there's none."""
+    try :
+        model = joblib.load(model_name)
+    except FileNotFoundError :
+        return None
+    return model if isinstance(model, RandomForestRegressor) else None
+
+def _mse(model, x, y) :
+    return float(mean_squared_error(y, model.predict(x))) if len(x) else None
+
+def update_model(data, model_name, config=None, watermark=None) -> dict : 
+    """
+    Full rebuild over all labeled hours. Returns a report; with the previous model around
+    it includes drift metrics - how the replaced (possibly incrementally updated) model
+    did on the hours since `watermark` and how far its predictions were from the rebuilt one.
+    """
+    with labeled(data) as (x, y) :
+        return _rebuild(x, y, model_name, config, watermark)
+
+def _rebuild(x, y, model_name, config=None, watermark=None) -> dict :
+    start = time.perf_counter()
+    previous = load_forest(model_name)
+    model = make_model(config or load_model_config(model_name))
+    fit(model, x, y)
+    save_model(model, model_name)
+
+    report = {'mode' : 'full', 'rows' : len(x), 'trees' : len(model.estimators_), 'watermark' : str(x.index.max())}
+    if previous is not None and list(previous.feature_names_in_) == list(x.columns) :
+        recent = x.iloc[-24 * 7:]
+        report['divergence'] = float(np.abs(previous.predict(recent) - model.predict(recent)).mean())
+        if watermark is not None :
+            unseen = x.index > pd.Timestamp(watermark)
+            report['previous_mse'] = _mse(previous, x[unseen], y[unseen])
+    report['fit_s'] = round(time.perf_counter() - start, 3)
+    return report
+
+def incremental_update(data, model_name, watermark, config=None) -> dict :
+    """
+    Warm-started update : fits k new trees on the hours since `watermark` (plus some recent
+    context) and retires the k oldest, k being the recent window's share of the forest
+    (at least 1, at most a quarter of it). Costs k trees on the window instead of the whole
+    forest on the whole history. Falls back to a full rebuild without a usable forest.
+    """
+    with labeled(data) as (x, y) :
+        return _warm_start(x, y, model_name, watermark, config)
+
+def _warm_start(x, y, model_name, watermark, config=None) -> dict :
+    start = time.perf_counter()
+    model = load_forest(model_name)
+    if model is None or list(model.feature_names_in_) != list(x.columns) :
+        return _rebuild(x, y, model_name, config, watermark)
+
+    new = x.index > pd.Timestamp(watermark)
+    new_rows = int(new.sum())
+    if new_rows == 0 :
+        return {'mode' : 'none', 'new_rows' : 0, 'watermark' : str(watermark)}
+    #prequential error - the current model on hours it has never seen
+    mse_before = _mse(model, x[new], y[new])
+
+    window = min(len(x), max(new_rows * RECENT_CONTEXT, 24 * 7))
+    trees = len(model.estimators_)
+    k = min(max(1, round(trees * window / len(x))), max(1, trees // 4))
+    model.set_params(warm_start=True, n_estimators=trees + k, n_jobs=-1)
+    fit(model, x.iloc[-window:], y.iloc[-window:])
+    model.estimators_ = model.estimators_[k:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+    save_model(model, model_name)
+
+    return {
+        'mode' : 'incremental',
+        'new_rows' : new_rows,
+        'window_rows' : window,
+        'trees_replaced' : k,
+        'mse_before' : mse_before,
+        'mse_after' : _mse(model, x[new], y[new]),
+        'watermark' : str(x.index.max()),
+        'fit_s' : round(time.perf_counter() - start, 3),
+    }
\ No newline at end of file
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+import joblib
+
+import compiled_forest
+import perf
+
+
+def file_hash(path: str) -> str:
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()[:12]
+
+
+def footprint(model) -> int:
+    """Approximate resident size (bytes) of a fitted forest's tree arrays."""
+    if isinstance(model, compiled_forest.CompiledForest):
+        return model.nbytes
+    total = 0
+    for estimator in getattr(model, "estimators_", []):
+        state = estimator.tree_.__getstate__()
+        total += state["nodes"].nbytes + state["values"].nbytes
+    return total
+
+
+class ModelRegistry:
+    """
+    Keeps the current pain model resident instead of joblib.load-ing it per prediction.
+    - get() reloads only when the file's mtime/size changed AND its content hash differs
+    - the last `keep` versions stay on disk as pain_model.<version>.pkl (hard links, the live
+      file is replaced by rename so its previous content survives) for rollback(), only the
+      current model is held in memory
+    With `compiled` the model is served from its array form (compiled_forest, exported next
+    to the pickle by ml.update_model) - memory mapped, so it loads without unpickling and its
+    pages are shared between processes. A missing / stale export is rebuilt from the pickle.
+    mmap_mode is passed to joblib.load for the pickle fallback.
+    get() / rollback() hash and (re)compile files, call them off the event loop after a change.
+    """
+
+    def __init__(self, path: str, keep: int = 3, mmap_mode=None, compiled=True):
+        self.path = path
+        self.keep = keep
+        self.mmap_mode = mmap_mode
+        self.compiled = compiled
+        self.compiled_path = compiled_forest.compiled_path(path)
+        self.model = None
+        self.version = None
+        self.load_time = None
+        #versions before the current one, oldest first, each kept as a file by version_path()
+        self.history = deque()
+        self._stat = None
+        self._lock = threading.Lock()
+
+    def version_path(self, version: str) -> str:
+        """pain_model.pkl -> pain_model.<version>.pkl"""
+        return f"{os.path.splitext(self.path)[0]}.{version}.pkl"
+
+    def _versions_on_disk(self) -> list:
+        """Versions kept by an earlier run, oldest first."""
+        stem = os.path.basename(os.path.splitext(self.path)[0])
+        pattern = re.compile(re.escape(stem) + r"\.([0-9a-f]{12})\.pkl")
+        directory = os.path.dirname(self.path) or "."
+        found = []
+        for name in os.listdir(directory):
+            match = pattern.fullmatch(name)
+            if match:
+                found.append((os.path.getmtime(os.path.join(directory, name)), match.group(1)))
+        return [version for _, version in sorted(found)]
+
+    def get(self):
+        """Returns the current model, reloading it if the file changed. None if there's no model yet."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return self.model
+            stat = (st.st_mtime_ns, st.st_size)
+            if stat != self._stat:
+                self._stat = stat
+                try:
+                    self._pin()
+                except Exception:
+                    #retried on the next get()
+                    self._stat = None
+                    raise
+            return self.model
+
+    def _pin(self):
+        #linked before hashing, a writer replacing the live file meanwhile can't mix two versions
+        pinned = self.path + ".pin"
+        _link(self.path, pinned)
+        version = file_hash(pinned)
+        if version == self.version:
+            os.remove(pinned)
+            return
+        os.replace(pinned, self.version_path(version))
+        if self.version is None:
+            #first load - versions an earlier run kept are still there to roll back to
+            self.history = deque(v for v in self._versions_on_disk() if v != version)
+        else:
+            self.history.append(self.version)
+        self._trim()
+        self._load(version)
+
+    def _trim(self):
+        while len(self.history) > self.keep:
+            _remove(self.version_path(self.history.popleft()))
+
+    def _load(self, version: str):
+        start = time.perf_counter()
+        self.model = self._read(version)
+        self.version = version
+        self.load_time = time.perf_counter() - start
+        perf.record("model.load", self.load_time)
+        print(f"Loaded model : {self.path} [{version}] in {self.load_time:.3f}s")
+
+    def _read(self, version: str):
+        path = self.version_path(version)
+        if not self.compiled:
+            return joblib.load(path, mmap_mode=self.mmap_mode)
+        meta = compiled_forest.read_meta(self.compiled_path)
+        if meta is not None and meta.get("source") == version:
+            try:
+                return compiled_forest.load(self.compiled_path)
+            except Exception as e:
+                print(f"Compiled model unreadable, recompiling : {e}")
+        #older model file, export failed or a rolled back version - compile it once, later loads are fast
+        model = joblib.load(path, mmap_mode=self.mmap_mode)
+        compiled_forest.export(model, self.compiled_path, source=version)
+        return compiled_forest.load(self.compiled_path)
+
+    def rollback(self) -> bool:
+        """Restores the previous version (on disk and in memory). False if there's nothing to roll back to."""
+        with self._lock:
+            if not self.history:
+                return False
+            version = self.history.pop()
+            replaced = self.version
+            #a link goes back in place of the live file, the version file stays for the next load
+            tmp_path = self.path + ".tmp"
+            _link(self.version_path(version), tmp_path)
+            os.replace(tmp_path, self.path)
+            st = os.stat(self.path)
+            self._stat = (st.st_mtime_ns, st.st_size)
+            self._load(version)
+            if replaced is not None and replaced != version:
+                _remove(self.version_path(replaced))
+        print(f"Rolled back model to [{version}]")
+        return True
+
+    def nbytes(self) -> int:
+        """Resident bytes of the current model (previous versions only live on disk)."""
+        return footprint(self.model) if self.model is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "format": type(self.model).__name__ if self.model is not None else None,
+            "load_time_s": None if self.load_time is None else round(self.load_time, 3),
+            "memory_mb": round(footprint(self.model) / 1e6, 2) if self.model is not None else None,
+            "file_mb": round(self._stat[1] / 1e6, 2) if self._stat else None,
+            "previous_versions": list(self.history),
+        }
+
+
+def _link(source: str, target: str):
+    """Hard links source to target (copies where links aren't supported), replacing target."""
+    _remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
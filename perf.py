@@ -0,0 +1,174 @@
+"""
+Lightweight latency metrics for the bot's hot paths.
+
+    with perf.span("model.predict"): ...
+    @perf.timed("store.read")
+    def read(...): ...
+
+Each name gets a fixed log-bucket histogram (count / sum / max since startup), so
+memory stays constant no matter how many calls are recorded. JOINTBOT_PERF=0 turns
+everything into no-ops: timed() returns the function untouched and span() returns
+a shared null context. JOINTBOT_PERF_DUMP=<path>.json|.prom makes dump() write a
+JSON or Prometheus-text snapshot.
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+ENABLED = os.getenv("JOINTBOT_PERF", "1") != "0"
+DUMP_PATH = os.getenv("JOINTBOT_PERF_DUMP")
+
+#0.1ms .. ~10min, each bucket 25% wider than the last
+BUCKETS = [0.0001 * 1.25 ** i for i in range(71)]
+_NULL = nullcontext()
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimated from the buckets, interpolating linearly inside the matching bucket."""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= target:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (target - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+_histograms: dict[str, Histogram] = {}
+_lock = threading.Lock()
+_started = time.time()
+
+
+def record(name: str, seconds: float):
+    if not ENABLED:
+        return
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = Histogram()
+        hist.add(seconds)
+
+
+@contextmanager
+def _span(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def span(name: str):
+    """Context manager timing its body under `name`."""
+    return _span(name) if ENABLED else _NULL
+
+
+def timed(name: str):
+    """Decorator timing every call (sync or async) under `name`."""
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    record(name, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict:
+    """{name: {count, mean, p50, p95, p99, max}} in milliseconds."""
+    with _lock:
+        items = sorted(_histograms.items())
+        return {
+            name: {
+                "count": h.count,
+                "mean_ms": round(h.total / h.count * 1000, 2) if h.count else 0.0,
+                "p50_ms": round(h.quantile(0.50) * 1000, 2),
+                "p95_ms": round(h.quantile(0.95) * 1000, 2),
+                "p99_ms": round(h.quantile(0.99) * 1000, 2),
+                "max_ms": round(h.max * 1000, 2),
+            }
+            for name, h in items
+        }
+
+
+def render_text() -> str:
+    """Fixed width table for the /perf command."""
+    if not ENABLED:
+        return "perf metrics disabled (JOINTBOT_PERF=0)"
+    rows = snapshot()
+    if not rows:
+        return "no samples yet"
+    width = max(len(name) for name in rows)
+    lines = [f"{'name':<{width}}  {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)"]
+    for name, s in rows.items():
+        lines.append(f"{name:<{width}}  {s['count']:>6} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8}")
+    lines.append(f"uptime {int(time.time() - _started)}s")
+    return "\n".join(lines)
+
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP jointbot_latency_seconds Latency of JointBot operations",
+        "# TYPE jointbot_latency_seconds histogram",
+    ]
+    with _lock:
+        for name, h in sorted(_histograms.items()):
+            cumulative = 0
+            for bound, n in zip(BUCKETS, h.counts):
+                cumulative += n
+                lines.append(f'jointbot_latency_seconds_bucket{{op="{name}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'jointbot_latency_seconds_bucket{{op="{name}",le="+Inf"}} {h.count}')
+            lines.append(f'jointbot_latency_seconds_sum{{op="{name}"}} {h.total:.6f}')
+            lines.append(f'jointbot_latency_seconds_count{{op="{name}"}} {h.count}')
+    return "\n".join(lines) + "\n"
+
+
+def dump(path: str | None = DUMP_PATH):
+    """Writes a JSON (or Prometheus text for *.prom) snapshot to `path`, if one is configured."""
+    if not ENABLED or not path:
+        return
+    body = render_prometheus() if path.endswith(".prom") else json.dumps(snapshot(), indent=2)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(body)
+    os.replace(tmp_path, path)
@@ -0,0 +1,139 @@
+import asyncio
+import heapq
+import sqlite3
+import time
+from collections import namedtuple
+
+#due = unix time, message = text to send, attempts = failed deliveries so far
+Reminder = namedtuple("Reminder", ["user_id", "channel_id", "due", "message", "attempts"])
+
+
+class ReminderStore:
+    """Pending reminders in SQLite, at most one per user (a new one replaces the old)."""
+
+    def __init__(self, path="reminders.db"):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS reminders ("
+                "user_id INTEGER PRIMARY KEY, channel_id INTEGER, due REAL, message TEXT, attempts INTEGER)"
+            )
+
+    def put(self, reminder: Reminder):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO reminders VALUES (?, ?, ?, ?, ?)", tuple(reminder))
+
+    def delete(self, user_id: int, due=None):
+        """Deletes the user's reminder - only if it's still the one due at `due`, when given."""
+        with self.conn:
+            if due is None:
+                self.conn.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+            else:
+                self.conn.execute("DELETE FROM reminders WHERE user_id = ? AND due = ?", (user_id, due))
+
+    def all(self) -> list:
+        return [Reminder(*row) for row in self.conn.execute("SELECT * FROM reminders")]
+
+    def close(self):
+        self.conn.close()
+
+
+class ReminderScheduler:
+    """
+    Every pending reminder in one min-heap, served by a single task that sleeps until the
+    earliest one is due (or a new one is scheduled). Nothing per user stays in memory but
+    a heap entry - no sleeping task, no interaction object - and the store makes reminders
+    survive restarts: start() reloads them and fires the ones missed while down, unless
+    they're more than `max_late` seconds late.
+    `deliver(reminder)` sends it (by channel / user id); a failed delivery is retried
+    `retry_delay` * attempts later, up to `max_attempts` times.
+    """
+
+    def __init__(self, store: ReminderStore, deliver, max_late=24 * 3600, retry_delay=300, max_attempts=5):
+        self.store = store
+        self.deliver = deliver
+        self.max_late = max_late
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self._heap: list[tuple[float, int]] = []
+        #the live reminder per user, heap entries that don't match it were cancelled / replaced
+        self._pending: dict[int, Reminder] = {}
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._loaded = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        if not self._loaded:
+            for reminder in self.store.all():
+                self._push(reminder)
+            self._loaded = True
+            print(f"Reminders loaded : {len(self._pending)} pending")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def _push(self, reminder: Reminder):
+        self._pending[reminder.user_id] = reminder
+        heapq.heappush(self._heap, (reminder.due, reminder.user_id))
+        #drop dead entries once they outnumber the live ones
+        if len(self._heap) > 2 * len(self._pending) + 64:
+            self._heap = [(r.due, r.user_id) for r in self._pending.values()]
+            heapq.heapify(self._heap)
+        self._wake.set()
+
+    def schedule(self, user_id: int, channel_id, delay: float, message: str) -> Reminder:
+        """Reminds `user_id` in `delay` seconds, replacing any reminder they already have."""
+        reminder = Reminder(user_id, channel_id, time.time() + delay, message, 0)
+        self.store.put(reminder)
+        self._push(reminder)
+        return reminder
+
+    def cancel(self, user_id: int) -> bool:
+        self.store.delete(user_id)
+        return self._pending.pop(user_id, None) is not None
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            while self._heap and self._heap[0][0] <= time.time():
+                due, user_id = heapq.heappop(self._heap)
+                reminder = self._pending.get(user_id)
+                if reminder is None or reminder.due != due:
+                    continue
+                del self._pending[user_id]
+                await self._fire(reminder)
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, reminder: Reminder):
+        late = time.time() - reminder.due
+        if self.max_late is not None and late > self.max_late:
+            print(f"Dropped reminder for [{reminder.user_id}], {late / 3600:.1f}h late")
+            self.store.delete(reminder.user_id, reminder.due)
+            return
+        try:
+            await self.deliver(reminder)
+        except Exception as e:
+            attempts = reminder.attempts + 1
+            self.store.delete(reminder.user_id, reminder.due)
+            if attempts >= self.max_attempts:
+                print(f"Reminder for [{reminder.user_id}] failed {attempts} times, dropped : {e}")
+                return
+            print(f"Reminder for [{reminder.user_id}] failed, retrying : {e}")
+            #a newer reminder scheduled meanwhile wins
+            if reminder.user_id not in self._pending:
+                retry = reminder._replace(due=time.time() + self.retry_delay * attempts, attempts=attempts)
+                self.store.put(retry)
+                self._push(retry)
+            return
+        self.store.delete(reminder.user_id, reminder.due)
@@ -0,0 +1,158 @@
+"""
+Tiered retention of the hourly history.
+
+- hot : the last HOT_DAYS of hours stay in data.db at full resolution (rolling features,
+        predictions, training)
+- archive : complete months older than that are moved into compressed columnar segments,
+        archive/<YYYY-MM>.npz next to data.db (one array per column, lossless), and deleted
+        from data.db - whose freed pages get reused, so it stops growing in steady state
+Only labeled hours are archived : backfilled hours no pain write has covered yet stay in
+data.db, where a later diary import can still label them (segments are never updated).
+Segments older than ARCHIVE_DAYS are deleted (kept forever by default). Training reads
+the archive too unless JOINTBOT_TRAIN_ARCHIVE=0 (see training_data.py).
+WeatherHandler.compact_history() runs it once a day from the refresh scheduler.
+"""
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import features
+import schema
+
+HOT_DAYS = int(os.getenv("JOINTBOT_HOT_DAYS", "730"))
+#None = archive segments are never deleted
+ARCHIVE_DAYS = int(os.getenv("JOINTBOT_ARCHIVE_DAYS")) if os.getenv("JOINTBOT_ARCHIVE_DAYS") else None
+SEGMENT_VERSION = 1
+
+
+def archive_dir(db_path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), "archive")
+
+
+def segment_path(directory: str, month: pd.Timestamp) -> str:
+    return os.path.join(directory, f"{month:%Y-%m}.npz")
+
+
+def segments(directory: str) -> list:
+    """(month, path) of every archived month, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        stem, ext = os.path.splitext(name)
+        if ext == ".npz":
+            found.append((pd.Timestamp(stem + "-01"), os.path.join(directory, name)))
+    return sorted(found)
+
+
+def write_segment(path: str, frame: pd.DataFrame):
+    """Writes store rows (indexed by time) as one compressed array per column, atomically."""
+    arrays = {"time": frame.index.values.astype("datetime64[s]").astype(np.int64), "version": np.array(SEGMENT_VERSION)}
+    for col in schema.columns:
+        arrays[col] = frame[col].to_numpy(dtype=bool if col == "is_actual" else np.float32)
+    tmp_path = path + ".tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def read_segment(path: str, typed: bool = True) -> pd.DataFrame:
+    """A segment back as store rows, in the store's dtypes (as stored, float32 / bool, without `typed`)."""
+    with np.load(path) as data:
+        index = pd.DatetimeIndex(data["time"].astype("datetime64[s]"), name="time").as_unit("ns")
+        frame = pd.DataFrame({col: data[col] for col in schema.columns if col in data.files}, index=index)
+    if not typed:
+        return frame
+    return frame.astype({col: dtype for col, dtype in schema.dtypes.items() if col in frame.columns})
+
+
+def segment_times(path: str) -> pd.DatetimeIndex:
+    with np.load(path) as data:
+        return pd.DatetimeIndex(data["time"].astype("datetime64[s]"), name="time").as_unit("ns")
+
+
+def iter_archive(directory: str, is_actual=True, found=None, exclude=None):
+    """
+    Archived rows month by month, oldest first, with the engineered features added
+    (computed over the previous month's tail too, so windows span month boundaries).
+    `found` is a segments() listing to read instead of listing again, hours in `exclude`
+    are left out. A segment expired since it was listed is skipped.
+    """
+    previous = None
+    lookback = timedelta(hours=features.LOOKBACK_HOURS)
+    for month, path in segments(directory) if found is None else found:
+        try:
+            frame = read_segment(path)
+        except FileNotFoundError:
+            continue
+        if frame.empty:
+            continue
+        context = frame if previous is None else pd.concat([previous.loc[frame.index[0] - lookback:], frame])
+        built = features.typed(features.build(context).loc[frame.index[0]:])
+        previous = frame
+        if is_actual is not None:
+            built = built[built["is_actual"] == is_actual]
+        if exclude is not None:
+            built = built[~built.index.isin(exclude)]
+        yield built
+
+
+def archive_rows(directory: str, found=None, exclude=None) -> int:
+    """Rows in the archive (or the `found` segments), hours in `exclude` not counted."""
+    rows = 0
+    for _, path in segments(directory) if found is None else found:
+        try:
+            times = segment_times(path)
+        except FileNotFoundError:
+            continue
+        rows += len(times) if exclude is None else int((~times.isin(exclude)).sum())
+    return rows
+
+
+def cutoff(now=None, hot_days: int = HOT_DAYS) -> pd.Timestamp:
+    """First hour that stays hot - months ending before it get archived. `now` = the location's wall clock."""
+    now = pd.Timestamp(now or datetime.now())
+    return (now - timedelta(days=hot_days)).normalize().replace(day=1)
+
+
+def compact_month(store, directory: str, month: pd.Timestamp) -> int:
+    """
+    Moves one month of labeled actual hours from `store` into its segment (merged with what's
+    there, store rows win) and deletes them from the store. Run it in the data writer, the
+    delete then commits with everything else in the batch.
+    """
+    end = month + pd.offsets.MonthBegin(1) - timedelta(hours=1)
+    rows = store.read(start=month, end=end, is_actual=True, labeled=True)
+    if rows.empty:
+        return 0
+    path = segment_path(directory, month)
+    if os.path.isfile(path):
+        #hours inserted again after the month was archived (e.g. a backfill)
+        plain = rows.astype({col: np.float32 for col in schema.columns if col != "is_actual"})
+        rows = plain.combine_first(read_segment(path, typed=False))[schema.columns]
+    os.makedirs(directory, exist_ok=True)
+    write_segment(path, rows)
+    store.delete_range(month, end, is_actual=True, labeled=True)
+    return len(rows)
+
+
+def months_to_compact(store, now=None, hot_days: int = HOT_DAYS) -> list:
+    first, _ = store.bounds(is_actual=True, labeled=True)
+    if first is None:
+        return []
+    last = cutoff(now, hot_days)
+    return [month for month in pd.date_range(first.normalize().replace(day=1), last, freq="MS") if month < last]
+
+
+def expire(directory: str, now=None, archive_days=ARCHIVE_DAYS) -> int:
+    """Deletes segments whose whole month is older than `archive_days`, returns how many."""
+    if archive_days is None:
+        return 0
+    oldest = pd.Timestamp(now or datetime.now()) - timedelta(days=archive_days)
+    expired = 0
+    for month, path in segments(directory):
+        if month + pd.offsets.MonthBegin(1) <= oldest:
+            os.remove(path)
+            expired += 1
+    return expired
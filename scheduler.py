@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import perf
+
+
+def local_now(timezone: str) -> datetime:
+    return datetime.now(ZoneInfo(timezone)).replace(tzinfo=None)
+
+
+class RefreshScheduler:
+    """
+    Runs data maintenance in the background instead of on the command path.
+    Every hour, for each tenant with a location:
+    - daily refresh (yesterday's actuals, next week's forecast + predicted pain) if the tenant's
+      local midnight has passed since its last one - this also catches up runs missed while down,
+      followed by compaction of old history (see retention.py)
+    - intraday update of actuals
+    - incremental model update once enough new labeled hours accumulated
+    After every run the handler's in-memory 7-day forecast snapshot is rebuilt.
+    """
+
+    def __init__(self, tenants, concurrency=8):
+        self.tenants = tenants
+        self.concurrency = concurrency
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            await self.run_once()
+            now = datetime.now()
+            next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            await asyncio.sleep((next_hour - now).total_seconds())
+
+    async def run_once(self):
+        #every location's weather in a handful of batched requests, the per-tenant refreshes then hit the cache
+        try:
+            await self.tenants.prefetch_weather()
+        except Exception as e:
+            print(f"Batched weather prefetch failed, tenants fetch individually : {e}")
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def one(tenant_id):
+            config = self.tenants.config(tenant_id)
+            if not config or 'timezone' not in config:
+                return
+            #borrowed, so an hourly pass doesn't pull every tenant through the LRU
+            async with limit, self.tenants.borrow(tenant_id) as handler:
+                await self.refresh(handler)
+
+        await asyncio.gather(*(one(tenant_id) for tenant_id in self.tenants.tenant_ids()))
+        perf.dump()
+
+    async def refresh(self, handler):
+        config = handler.config.get()
+        if config is None or 'timezone' not in config:
+            return
+        #location set but the initial fetch never happened (upstream was down during /local)
+        await self._guard(self.setup, handler)
+        midnight = local_now(config['timezone']).replace(hour=0, minute=0, second=0, microsecond=0)
+        last = handler.store.get_meta('last_daily_refresh')
+        if last is None or datetime.fromisoformat(last) < midnight:
+            await self._guard(self.daily, handler)
+            await self._guard(self.compact, handler)
+        await self._guard(self.hourly, handler)
+        await self._guard(self.retrain, handler)
+
+    async def _guard(self, job, handler):
+        #one failed refresh (upstream down etc) shouldn't kill the scheduler
+        try:
+            await job(handler)
+        except Exception as e:
+            print(f"Scheduled {job.__name__} refresh failed for [{handler.name}] : {e}")
+
+    async def setup(self, handler):
+        await handler.setup()
+
+    @perf.timed("refresh.hourly")
+    async def hourly(self, handler):
+        now_ts = handler._clean_timestamp(str(handler.local_now()))
+        await handler.intraday_routine(now_ts)
+        handler.refresh_snapshot()
+
+    @perf.timed("refresh.retrain")
+    async def retrain(self, handler):
+        #incremental model update when enough new hours are labeled, periodically a full rebuild
+        await handler.auto_update_model()
+
+    @perf.timed("refresh.compact")
+    async def compact(self, handler):
+        #old months out of data.db into archive segments, keeps the hot tier a fixed size
+        await handler.compact_history()
+
+    @perf.timed("refresh.daily")
+    async def daily(self, handler):
+        now_ts = handler._clean_timestamp(str(handler.local_now()))
+        yesterday = now_ts - timedelta(days=1)
+        next_week = now_ts + timedelta(days=7)
+        await handler.forecast_routine(yesterday, now_ts, next_week)
+        await handler.writer.submit(handler.store.set_meta, 'last_daily_refresh', handler.local_now().isoformat())
+        handler.refresh_snapshot()
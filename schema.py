@@ -0,0 +1,25 @@
+#hourly weather variables fetched from Open-Meteo (and stored / used as model inputs)
+conditions = [
+                "temperature_2m", "relative_humidity_2m", "dew_point_2m",
+                "apparent_temperature", "precipitation_probability", "precipitation",
+                "rain", "showers", "snowfall", "snow_depth", "weather_code",
+                "pressure_msl", "surface_pressure", "cloud_cover", "cloud_cover_low",
+                "cloud_cover_mid", "cloud_cover_high", "visibility",
+                "evapotranspiration", "et0_fao_evapotranspiration",
+                "vapour_pressure_deficit"
+            ]
+
+#every column of the hourly data store
+columns = ["pain_level", "predicted_pain", "is_actual"] + conditions
+
+#in-memory dtypes of the hourly columns (applied by the data store on every read)
+#measurements fit float32 (what the forest computes in anyway), percentages stay float since
+#Open-Meteo returns nulls for some of them (e.g. precipitation_probability for past hours)
+dtypes = {
+    "pain_level": "float32",
+    "predicted_pain": "float32",
+    "is_actual": "bool",
+    **{col: "float32" for col in conditions},
+    #WMO code, a handful of distinct values
+    "weather_code": "category",
+}
@@ -0,0 +1,443 @@
+import abc
+import sqlite3
+from contextlib import contextmanager
+
+import pandas as pd
+
+import perf
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+#meta key set once data.csv has been imported
+MIGRATED = "migrated"
+
+def to_key(timestamp) -> str:
+    """Normalizes a datetime / string timestamp into the store's hour key."""
+    return pd.Timestamp(timestamp).strftime(TIME_FORMAT)
+
+
+class DataStore(abc.ABC):
+    """
+    Interface for the hourly data store behind WeatherHandler.
+    Rows are keyed by hour; every method only touches the rows it is asked about,
+    so the cost of a write doesn't depend on how much history is kept.
+    """
+
+    @abc.abstractmethod
+    def read(self, start=None, end=None, is_actual=None, columns=None, labeled=None) -> pd.DataFrame:
+        """
+        Returns rows in [start, end] indexed by time, optionally filtered on is_actual and on
+        `labeled` (False = hours inserted by insert_unlabeled() that no pain write covered yet).
+        """
+
+    @abc.abstractmethod
+    def upsert(self, frame: pd.DataFrame, columns=None):
+        """
+        Inserts the rows of `frame` (indexed by time). For hours that already exist
+        only `columns` are overwritten (defaults to every column in `frame`).
+        """
+
+    @abc.abstractmethod
+    def insert_unlabeled(self, frame: pd.DataFrame) -> int:
+        """
+        Inserts the hours of `frame` that aren't in the store yet (existing ones are left as
+        they are) and records them as unlabeled, until a pain_level write covers them.
+        Returns how many were inserted.
+        """
+
+    @abc.abstractmethod
+    def update_range(self, column: str, value, start=None, end=None, is_actual=None):
+        """Sets `column` to a single `value` for every row in [start, end]."""
+
+    @abc.abstractmethod
+    def update_values(self, column: str, times, values):
+        """Sets `column` row by row for the given hours."""
+
+    @abc.abstractmethod
+    def get_value(self, time, column: str):
+        """Point read of a single cell, None if the hour doesn't exist."""
+
+    @abc.abstractmethod
+    def delete_range(self, start=None, end=None, is_actual=None, labeled=None):
+        """Deletes the rows in [start, end] (and their features)."""
+
+    @abc.abstractmethod
+    def bounds(self, is_actual=None, labeled=None):
+        """Returns the (first, last) hour in the store (optionally only actuals / forecasts), or (None, None) when empty."""
+
+    @abc.abstractmethod
+    def reset_features(self, names: list):
+        """(Re)creates the empty feature table with the given feature columns."""
+
+    @abc.abstractmethod
+    def upsert_features(self, frame: pd.DataFrame):
+        """Inserts / overwrites feature rows (indexed by time)."""
+
+    @abc.abstractmethod
+    def read_features(self, start=None, end=None, is_actual=None, labeled=None) -> pd.DataFrame:
+        """Like read(), with the materialized feature columns joined on."""
+
+    @abc.abstractmethod
+    def iter_features(self, start=None, end=None, is_actual=None, chunk_rows: int = 50_000, labeled=None):
+        """read_features() as consecutive frames of at most `chunk_rows` rows, oldest first."""
+
+    @abc.abstractmethod
+    def count(self, start=None, end=None, is_actual=None, labeled=None) -> int:
+        """Number of rows in [start, end] (optionally only actuals / forecasts)."""
+
+    @abc.abstractmethod
+    def recent_start(self, rows: int, is_actual=None, labeled=None):
+        """First hour of the `rows` most recent ones (optionally only actuals / forecasts), None when empty."""
+
+    @abc.abstractmethod
+    def get_meta(self, key: str):
+        """Value stored under `key` in the store's key / value table, None if unset."""
+
+    @abc.abstractmethod
+    def set_meta(self, key: str, value: str):
+        """Sets `key` in the store's key / value table."""
+
+    @contextmanager
+    def batch(self):
+        """Groups every mutation inside the block into one commit."""
+        yield
+
+    @contextmanager
+    def mutation(self):
+        """Scope whose writes are all undone if the block raises (inside a batch too)."""
+        yield
+
+    @contextmanager
+    def snapshot(self):
+        """Every read inside the block sees the same state of the store, whatever commits meanwhile."""
+        yield
+
+    def close(self):
+        pass
+
+
+class SQLiteStore(DataStore):
+    """
+    SQLite backed store - one table keyed by hour (WITHOUT ROWID, so the primary key
+    is the clustered index). Point upserts / range updates / range reads are all
+    index lookups.
+    """
+
+    table = "hourly"
+    features_table = "features"
+    #hours inserted without a pain level (historical backfill), see insert_unlabeled()
+    unlabeled_table = "unlabeled"
+
+    def __init__(self, path: str, columns: list, dtypes: dict = None):
+        self.path = path
+        self.columns = list(columns)
+        #per column dtypes for frames coming out of read() / read_features() (see schema.dtypes)
+        self.dtypes = dict(dtypes or {})
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._batching = False
+        self._create()
+
+    def _create(self):
+        cols = []
+        for col in self.columns:
+            if col == "is_actual":
+                cols.append(f"{col} INTEGER NOT NULL DEFAULT 0")
+            elif col in ("pain_level", "predicted_pain"):
+                cols.append(f"{col} REAL NOT NULL DEFAULT 0.0")
+            else:
+                cols.append(f"{col} REAL")
+        with self.conn:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                f"(time TEXT PRIMARY KEY, {', '.join(cols)}) WITHOUT ROWID"
+            )
+            #only the forecast rows (~168) are ever is_actual = 0, keeps "mark as actual" cheap
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_forecast "
+                f"ON {self.table}(time) WHERE is_actual = 0"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {self.unlabeled_table} (time TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.feature_columns = [
+            row[1] for row in self.conn.execute(f"PRAGMA table_info({self.features_table})")
+        ][1:]
+
+    @contextmanager
+    def batch(self):
+        """
+        One transaction for every mutation inside the block, committed at the end.
+        Each mutation gets its own savepoint, so one that fails is rolled back alone
+        and the rest of the batch still commits.
+        """
+        self.conn.execute("BEGIN")
+        self._batching = True
+        try:
+            yield self
+        except BaseException:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._batching = False
+
+    @contextmanager
+    def snapshot(self):
+        """
+        One read transaction for the block - with WAL the first read pins the snapshot and
+        every later one sees it too, commits of other connections meanwhile stay invisible.
+        """
+        self.conn.execute("BEGIN")
+        try:
+            yield self
+        finally:
+            self.conn.rollback()
+
+    @contextmanager
+    def mutation(self):
+        """Transaction scope of a single mutation - its own commit, or a savepoint inside batch()."""
+        if not self._batching:
+            with self.conn:
+                yield
+            return
+        self.conn.execute("SAVEPOINT mutation")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK TO mutation")
+            self.conn.execute("RELEASE mutation")
+            raise
+        self.conn.execute("RELEASE mutation")
+
+    def _where(self, start=None, end=None, is_actual=None, labeled=None):
+        clauses, params = [], []
+        if labeled is not None:
+            clauses.append(f"time {'NOT IN' if labeled else 'IN'} (SELECT time FROM {self.unlabeled_table})")
+        if is_actual is not None:
+            clauses.append("is_actual = ?")
+            params.append(int(is_actual))
+        if start is not None:
+            clauses.append("time >= ?")
+            params.append(to_key(start))
+        if end is not None:
+            clauses.append("time <= ?")
+            params.append(to_key(end))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    @perf.timed("store.read")
+    def read(self, start=None, end=None, is_actual=None, columns=None, labeled=None) -> pd.DataFrame:
+        columns = self.columns if columns is None else list(columns)
+        where, params = self._where(start, end, is_actual, labeled)
+        sql = f"SELECT time, {', '.join(columns)} FROM {self.table}{where} ORDER BY time"
+        return self._typed(pd.read_sql_query(sql, self.conn, params=params, index_col="time"))
+
+    def _typed(self, df: pd.DataFrame) -> pd.DataFrame:
+        #keys are always TIME_FORMAT, an explicit format skips per-row format inference
+        df.index = pd.to_datetime(df.index, format=TIME_FORMAT)
+        df.index.name = "time"
+        dtypes = {col: dtype for col, dtype in self.dtypes.items() if col in df.columns}
+        if "is_actual" in df.columns:
+            dtypes.setdefault("is_actual", bool)
+        return df.astype(dtypes) if dtypes else df
+
+    @perf.timed("store.upsert")
+    def upsert(self, frame: pd.DataFrame, columns=None):
+        if frame.empty:
+            return
+        insert_cols = [col for col in frame.columns if col in self.columns]
+        update_cols = insert_cols if columns is None else [col for col in columns if col in insert_cols]
+
+        placeholders = ", ".join("?" for _ in range(len(insert_cols) + 1))
+        if update_cols:
+            conflict = "DO UPDATE SET " + ", ".join(f"{col}=excluded.{col}" for col in update_cols)
+        else:
+            conflict = "DO NOTHING"
+        sql = (
+            f"INSERT INTO {self.table} (time, {', '.join(insert_cols)}) VALUES ({placeholders}) "
+            f"ON CONFLICT(time) {conflict}"
+        )
+
+        keys = [to_key(ts) for ts in frame.index]
+        values = [frame[col].tolist() for col in insert_cols]
+        with self.mutation():
+            self.conn.executemany(sql, zip(keys, *values))
+
+    @perf.timed("store.insert_unlabeled")
+    def insert_unlabeled(self, frame: pd.DataFrame) -> int:
+        if frame.empty:
+            return 0
+        keys = [(to_key(ts),) for ts in frame.index]
+        with self.mutation():
+            #recorded first, while "not in the store yet" can still be told apart
+            before = self.conn.total_changes
+            self.conn.executemany(
+                f"INSERT OR IGNORE INTO {self.unlabeled_table} (time) "
+                f"SELECT ?1 WHERE NOT EXISTS (SELECT 1 FROM {self.table} WHERE time = ?1)", keys
+            )
+            inserted = self.conn.total_changes - before
+            self.upsert(frame, columns=[])
+        return inserted
+
+    @perf.timed("store.update_range")
+    def update_range(self, column: str, value, start=None, end=None, is_actual=None):
+        where, params = self._where(start, end, is_actual)
+        with self.mutation():
+            if column == "pain_level":
+                self.conn.execute(
+                    f"DELETE FROM {self.unlabeled_table} WHERE time IN (SELECT time FROM {self.table}{where})", params
+                )
+            self.conn.execute(f"UPDATE {self.table} SET {column} = ?{where}", [_py(value)] + params)
+
+    @perf.timed("store.update_values")
+    def update_values(self, column: str, times, values):
+        rows = [(_py(value), to_key(ts)) for ts, value in zip(times, values)]
+        with self.mutation():
+            if column == "pain_level":
+                self.conn.executemany(f"DELETE FROM {self.unlabeled_table} WHERE time = ?", [(key,) for _, key in rows])
+            self.conn.executemany(f"UPDATE {self.table} SET {column} = ? WHERE time = ?", rows)
+
+    @perf.timed("store.delete_range")
+    def delete_range(self, start=None, end=None, is_actual=None, labeled=None):
+        where, params = self._where(start, end, is_actual, labeled)
+        with self.mutation():
+            if self.feature_columns:
+                self.conn.execute(
+                    f"DELETE FROM {self.features_table} WHERE time IN (SELECT time FROM {self.table}{where})", params
+                )
+            if labeled is not True:
+                self.conn.execute(
+                    f"DELETE FROM {self.unlabeled_table} WHERE time IN (SELECT time FROM {self.table}{where})", params
+                )
+            self.conn.execute(f"DELETE FROM {self.table}{where}", params)
+
+    @perf.timed("store.get_value")
+    def get_value(self, time, column: str):
+        row = self.conn.execute(
+            f"SELECT {column} FROM {self.table} WHERE time = ?", (to_key(time),)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def bounds(self, is_actual=None, labeled=None):
+        where, params = self._where(is_actual=is_actual, labeled=labeled)
+        first, last = self.conn.execute(f"SELECT MIN(time), MAX(time) FROM {self.table}{where}", params).fetchone()
+        if first is None:
+            return None, None
+        return pd.Timestamp(first), pd.Timestamp(last)
+
+    def reset_features(self, names: list):
+        cols = ", ".join(f"{name} REAL" for name in names)
+        with self.mutation():
+            self.conn.execute(f"DROP TABLE IF EXISTS {self.features_table}")
+            self.conn.execute(
+                f"CREATE TABLE {self.features_table} (time TEXT PRIMARY KEY, {cols}) WITHOUT ROWID"
+            )
+        self.feature_columns = list(names)
+
+    @perf.timed("store.upsert_features")
+    def upsert_features(self, frame: pd.DataFrame):
+        if frame.empty:
+            return
+        cols = self.feature_columns
+        placeholders = ", ".join("?" for _ in range(len(cols) + 1))
+        sql = f"INSERT OR REPLACE INTO {self.features_table} (time, {', '.join(cols)}) VALUES ({placeholders})"
+        keys = [to_key(ts) for ts in frame.index]
+        values = [frame[col].tolist() for col in cols]
+        with self.mutation():
+            self.conn.executemany(sql, zip(keys, *values))
+
+    def _features_sql(self, start=None, end=None, is_actual=None, labeled=None):
+        where, params = self._where(start, end, is_actual, labeled)
+        cols = [f"h.{col}" for col in self.columns] + [f"f.{col}" for col in self.feature_columns]
+        sql = (
+            f"SELECT time, {', '.join(cols)} FROM {self.table} h "
+            f"JOIN {self.features_table} f USING(time){where} ORDER BY time"
+        )
+        return sql, params
+
+    @perf.timed("store.read_features")
+    def read_features(self, start=None, end=None, is_actual=None, labeled=None) -> pd.DataFrame:
+        sql, params = self._features_sql(start, end, is_actual, labeled)
+        return self._typed(pd.read_sql_query(sql, self.conn, params=params, index_col="time"))
+
+    def iter_features(self, start=None, end=None, is_actual=None, chunk_rows: int = 50_000, labeled=None):
+        #one query, fetched chunk by chunk - never more than chunk_rows rows in memory
+        sql, params = self._features_sql(start, end, is_actual, labeled)
+        for chunk in pd.read_sql_query(sql, self.conn, params=params, index_col="time", chunksize=chunk_rows):
+            yield self._typed(chunk)
+
+    def count(self, start=None, end=None, is_actual=None, labeled=None) -> int:
+        where, params = self._where(start, end, is_actual, labeled)
+        return self.conn.execute(f"SELECT COUNT(*) FROM {self.table}{where}", params).fetchone()[0]
+
+    def recent_start(self, rows: int, is_actual=None, labeled=None):
+        where, params = self._where(is_actual=is_actual, labeled=labeled)
+        row = self.conn.execute(
+            f"SELECT time FROM {self.table}{where} ORDER BY time DESC LIMIT 1 OFFSET ?", params + [max(rows - 1, 0)]
+        ).fetchone()
+        if row is None:
+            return self.bounds(is_actual, labeled)[0]
+        return pd.Timestamp(row[0])
+
+    def get_meta(self, key: str):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_meta(self, key: str, value: str):
+        with self.mutation():
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def close(self):
+        self.conn.close()
+
+
+def _py(value):
+    """Unwraps numpy scalars so sqlite3 can bind them."""
+    return value.item() if hasattr(value, "item") else value
+
+
+def read_csv(csv_path: str, dtypes: dict = None, chunksize: int = None):
+    """
+    Typed data.csv load - declared dtypes instead of inference, the time column parsed with
+    its known format. Returns a frame, or an iterator of frames with `chunksize`.
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns
+    dtype = {col: value for col, value in (dtypes or {}).items() if col in header}
+    #the parser would make categories of the raw text, parse the numbers first
+    categorical = [col for col, value in dtype.items() if value == "category"]
+    dtype.update({col: "float64" for col in categorical})
+    frames = pd.read_csv(csv_path, index_col="time", dtype=dtype, chunksize=chunksize)
+    if chunksize is None:
+        return _finish(frames, categorical)
+    return (_finish(frame, categorical) for frame in frames)
+
+
+def _finish(frame: pd.DataFrame, categorical: list) -> pd.DataFrame:
+    frame.index = pd.to_datetime(frame.index, format="ISO8601")
+    frame.index.name = "time"
+    return frame.astype({col: "category" for col in categorical}) if categorical else frame
+
+
+def write_csv(frame: pd.DataFrame, csv_path: str):
+    """Saves a frame in the data.csv layout, read_csv() loads it back with the same dtypes."""
+    frame.to_csv(csv_path, index_label="time", date_format=TIME_FORMAT)
+
+
+def migrate_csv(csv_path: str, store: DataStore, chunksize: int = 50_000) -> int:
+    """
+    One-shot migration of the legacy data.csv layout into `store`.
+    Reads the CSV in chunks so the whole history never has to be in memory at once, all of
+    them in one transaction together with the MIGRATED flag - a migration that dies half way
+    leaves the store as it was, and runs again on the next start.
+    """
+    if store.get_meta(MIGRATED) is not None:
+        return 0
+    rows = 0
+    with store.batch():
+        for chunk in read_csv(csv_path, getattr(store, "dtypes", None), chunksize=chunksize):
+            store.upsert(chunk)
+            rows += len(chunk)
+        store.set_meta(MIGRATED, csv_path)
+    print(f"Migrated {rows} rows from {csv_path}")
+    return rows
@@ -0,0 +1,130 @@
+"""
+Local stand-in for the Open-Meteo forecast, archive and geocoding endpoints.
+Serves deterministic canned data so the bot (and benchmarks) can run without network:
+
+    python stub_server.py --port 8080 --delay 0.5
+    OPEN_METEO_FORECAST_URL=http://127.0.0.1:8080/v1/forecast \
+    OPEN_METEO_GEOCODING_URL=http://127.0.0.1:8080/v1/search \
+    OPEN_METEO_ARCHIVE_URL=http://127.0.0.1:8080/v1/archive python main.py
+"""
+import argparse
+import asyncio
+import math
+from datetime import date, datetime, timedelta
+from aiohttp import web
+
+
+def hourly_values(variable: str, lat: float, start: date, end: date) -> dict:
+    """Smooth, deterministic fake weather for every hour in [start, end]."""
+    times, values = [], []
+    t = datetime(start.year, start.month, start.day)
+    stop = datetime(end.year, end.month, end.day) + timedelta(days=1)
+    seed = sum(map(ord, variable)) % 17
+    while t < stop:
+        hours = (t - datetime(2000, 1, 1)).total_seconds() / 3600
+        wave = math.sin((hours + seed) / 24 * 2 * math.pi)
+        slow = math.sin((hours + lat) / (24 * 5) * 2 * math.pi)
+        if variable == "weather_code":
+            value = int(abs(slow) * 3)
+        elif variable.startswith("pressure") or variable == "surface_pressure":
+            value = round(1013 + 8 * slow + wave, 1)
+        elif variable in ("relative_humidity_2m", "precipitation_probability") or variable.startswith("cloud_cover"):
+            value = int(50 + 40 * wave * slow)
+        elif variable == "visibility":
+            value = round(20000 + 4000 * wave, 1)
+        else:
+            value = round(10 + 8 * wave + 4 * slow, 2)
+        times.append(t.strftime("%Y-%m-%dT%H:%M"))
+        values.append(value)
+        t += timedelta(hours=1)
+    return {"time": times, variable: values}
+
+
+def forecast_body(lat: float, lon: float, timezone: str, variables: list, start: date, end: date) -> dict:
+    hourly = {}
+    for variable in variables:
+        hourly.update(hourly_values(variable, lat, start, end))
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "timezone": timezone,
+        "hourly_units": {variable: "" for variable in variables},
+        "hourly": hourly,
+    }
+
+
+def make_app(delay: float = 0.0) -> web.Application:
+    app = web.Application()
+    app["requests"] = 0
+
+    async def forecast(request: web.Request):
+        app["requests"] += 1
+        if delay:
+            await asyncio.sleep(delay)
+        q = request.query
+        variables = [v for v in q.get("hourly", "").split(",") if v]
+        start = date.fromisoformat(q["start_date"])
+        end = date.fromisoformat(q["end_date"])
+        #like Open-Meteo : comma separated coordinates -> one result per location, as a list
+        lats = [float(v) for v in q["latitude"].split(",")]
+        lons = [float(v) for v in q["longitude"].split(",")]
+        zones = q.get("timezone", "GMT").split(",")
+        if len(zones) == 1:
+            zones = zones * len(lats)
+        bodies = [
+            forecast_body(lat, lon, zone, variables, start, end)
+            for lat, lon, zone in zip(lats, lons, zones)
+        ]
+        return web.json_response(bodies if len(bodies) > 1 else bodies[0])
+
+    async def archive(request: web.Request):
+        #historical weather, one location per request
+        app["requests"] += 1
+        if delay:
+            await asyncio.sleep(delay)
+        q = request.query
+        variables = [v for v in q.get("hourly", "").split(",") if v]
+        start = date.fromisoformat(q["start_date"])
+        end = date.fromisoformat(q["end_date"])
+        return web.json_response(
+            forecast_body(float(q["latitude"]), float(q["longitude"]), q.get("timezone", "GMT"), variables, start, end)
+        )
+
+    async def search(request: web.Request):
+        app["requests"] += 1
+        if delay:
+            await asyncio.sleep(delay)
+        name = request.query.get("name", "")
+        if not name or name.startswith("INVALID"):
+            return web.json_response({"generationtime_ms": 0.1})
+        return web.json_response({"results": [{
+            "name": name,
+            "latitude": 40.6501,
+            "longitude": -73.94958,
+            "timezone": "America/New_York",
+            "country_code": request.query.get("countryCode", "US"),
+        }]})
+
+    app.router.add_get("/v1/forecast", forecast)
+    app.router.add_get("/v1/archive", archive)
+    app.router.add_get("/v1/search", search)
+    return app
+
+
+async def start_stub(host: str = "127.0.0.1", port: int = 0, delay: float = 0.0):
+    """Starts the stub in the running loop. Returns (runner, base_url)."""
+    runner = web.AppRunner(make_app(delay))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Open-Meteo stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds of artificial latency per request")
+    args = parser.parse_args()
+    web.run_app(make_app(args.delay), host=args.host, port=args.port)
@@ -0,0 +1,202 @@
+import asyncio
+import os
+import shutil
+import time
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+
+import http_client
+import jobs
+import schema
+from config_store import ConfigStore
+from weather_batch import BatchWeatherFetcher, refresh_window
+from weather_cache import WeatherCache
+
+#files a single-user install keeps in the bot's directory
+LEGACY_FILES = ("config.json", "data.db", "data.csv", "pain_model.pkl")
+
+
+class TenantManager:
+    """
+    One data partition per user (or per guild): users/<id>/ holds that tenant's
+    config.json (location), data.db and pain_model.pkl.
+    Loaded WeatherHandlers are kept in an LRU bounded by count and an estimated
+    memory budget. A tenant has at most one open handler (one store connection, one
+    writer) : an evicted handler stays open until it's been idle for `idle_close`
+    seconds and is handed out again if its tenant comes back before that, background
+    jobs borrow() handlers without making them resident. The HTTP client, weather cache and training process pool are
+    shared, so weather fetches scale with distinct locations, not users.
+    WeatherHandler (pandas / scikit-learn) is imported on first use or by prewarm(),
+    so creating the manager is cheap. Handlers are built in a thread (CSV migration,
+    feature rebuilds and the first model load never block the event loop), concurrent
+    requests for a tenant that's still opening wait on the same build.
+    """
+
+    def __init__(self, root="users", mode="user", max_loaded=32, memory_budget_mb=512,
+                 legacy_owner=None, idle_close=300, **handler_kwargs):
+        self.root = root
+        self.mode = mode
+        self.max_loaded = max_loaded
+        self.memory_budget = memory_budget_mb * 1_000_000
+        self.idle_close = idle_close
+        #tenant id that inherits the files of a pre-tenancy single-user install
+        self.legacy_owner = None if legacy_owner is None else str(legacy_owner)
+        os.makedirs(root, exist_ok=True)
+        self.http = http_client.get_client()
+        self.weather_cache = WeatherCache(os.path.join(root, "weather_cache.db"))
+        self.jobs = jobs.JobRunner()
+        #one /tune at a time across tenants, apart from the training pool (see tuning.py)
+        self.tuning = jobs.JobRunner()
+        self.fetcher = BatchWeatherFetcher(
+            self.http, self.weather_cache,
+            handler_kwargs.get('forecast_url', http_client.FORECAST_URL), schema.conditions,
+        )
+        self.handler_kwargs = handler_kwargs
+        self._loaded: OrderedDict[str, "WeatherHandler.WeatherHandler"] = OrderedDict()
+        #every open handler - the LRU plus evicted / borrowed ones not closed yet
+        self._open: dict[str, "WeatherHandler.WeatherHandler"] = {}
+        self._last_used: dict[str, float] = {}
+        self._borrowed = Counter()
+        #tenants whose handler is being built
+        self._opening: dict[str, asyncio.Task] = {}
+
+    def key_for(self, interaction) -> str:
+        if self.mode == "guild" and interaction.guild_id is not None:
+            return str(interaction.guild_id)
+        return str(interaction.user.id)
+
+    def path(self, tenant_id: str, name: str) -> str:
+        return os.path.join(self.root, tenant_id, name)
+
+    def tenant_ids(self) -> list:
+        return sorted(
+            entry for entry in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, entry))
+        )
+
+    def _adopt_legacy(self, tenant_id: str):
+        directory = os.path.join(self.root, tenant_id)
+        if tenant_id != self.legacy_owner or os.path.isdir(directory):
+            return
+        os.makedirs(directory)
+        for name in LEGACY_FILES:
+            if os.path.isfile(name):
+                shutil.copy2(name, os.path.join(directory, name))
+        print(f"Legacy data copied into {directory}")
+
+    def prewarm(self):
+        """Imports the data / model stack ahead of the first command (blocking, run it in a thread)."""
+        import WeatherHandler
+
+    async def get(self, tenant_id: str) -> "WeatherHandler.WeatherHandler":
+        """Returns the tenant's handler, loading it (and evicting cold tenants) if needed."""
+        tenant_id = str(tenant_id)
+        self._last_used[tenant_id] = time.monotonic()
+        handler = self._loaded.get(tenant_id)
+        if handler is not None:
+            self._loaded.move_to_end(tenant_id)
+            return handler
+
+        #evicted / borrowed but still open, never a second handler on the same data.db
+        handler = await self.open(tenant_id)
+        if tenant_id not in self._loaded:
+            self._loaded[tenant_id] = handler
+            self._evict()
+        return handler
+
+    async def open(self, tenant_id: str) -> "WeatherHandler.WeatherHandler":
+        """The tenant's open handler, built in a thread if there's none yet."""
+        tenant_id = str(tenant_id)
+        handler = self._open.get(tenant_id)
+        if handler is not None:
+            return handler
+        task = self._opening.get(tenant_id)
+        if task is None:
+            task = asyncio.create_task(self._open_handler(tenant_id))
+            self._opening[tenant_id] = task
+            task.add_done_callback(lambda _: self._opening.pop(tenant_id, None))
+        #shield so a waiter giving up (see main.gated) doesn't cancel the build for everyone else
+        return await asyncio.shield(task)
+
+    @asynccontextmanager
+    async def borrow(self, tenant_id: str):
+        """The tenant's handler for a background job, closed again afterwards unless it's loaded."""
+        tenant_id = str(tenant_id)
+        handler = await self.open(tenant_id)
+        self._borrowed[tenant_id] += 1
+        try:
+            yield handler
+        finally:
+            self._borrowed[tenant_id] -= 1
+            self._close_idle()
+
+    async def _open_handler(self, tenant_id: str) -> "WeatherHandler.WeatherHandler":
+        handler = await asyncio.to_thread(self._build_handler, tenant_id)
+        self._open[tenant_id] = handler
+        return handler
+
+    def _build_handler(self, tenant_id: str) -> "WeatherHandler.WeatherHandler":
+        import WeatherHandler
+
+        self._adopt_legacy(tenant_id)
+        os.makedirs(os.path.join(self.root, tenant_id), exist_ok=True)
+        handler = WeatherHandler.WeatherHandler(
+            db_path=self.path(tenant_id, "data.db"),
+            pain_model=self.path(tenant_id, "pain_model.pkl"),
+            csv_path=self.path(tenant_id, "data.csv"),
+            http=self.http,
+            weather_cache=self.weather_cache,
+            config=ConfigStore(self.path(tenant_id, "config.json")),
+            name=tenant_id,
+            job_runner=self.jobs,
+            tune_runner=self.tuning,
+            **self.handler_kwargs,
+        )
+        #the model is loaded (and compiled if needed) here too, not by the first prediction
+        try:
+            handler.models.get()
+        except Exception as e:
+            print(f"Model load error for [{tenant_id}] : {e}")
+        return handler
+
+    async def for_interaction(self, interaction) -> "WeatherHandler.WeatherHandler":
+        return await self.get(self.key_for(interaction))
+
+    def config(self, tenant_id: str):
+        """A tenant's config without loading its handler."""
+        self._adopt_legacy(tenant_id)
+        handler = self._open.get(tenant_id)
+        store = handler.config if handler is not None else ConfigStore(self.path(tenant_id, "config.json"))
+        return store.get()
+
+    async def prefetch_weather(self) -> int:
+        """Fills the shared cache for every tenant's next refresh in as few batched requests as possible."""
+        windows = [refresh_window(self.config(tenant_id)) for tenant_id in self.tenant_ids()]
+        return await self.fetcher.fetch_many([window for window in windows if window is not None])
+
+    def memory_usage(self) -> int:
+        return sum(handler.memory_estimate() for handler in self._loaded.values())
+
+    def _evict(self):
+        #least recently used first, never the tenant just loaded or one that's training
+        for tenant_id in list(self._loaded)[:-1]:
+            if len(self._loaded) <= self.max_loaded and self.memory_usage() <= self.memory_budget:
+                break
+            if self._loaded[tenant_id].busy():
+                continue
+            #out of the LRU, closed by _close_idle once commands still holding it are done
+            del self._loaded[tenant_id]
+            print(f"Evicted tenant {tenant_id}")
+        self._close_idle()
+
+    def _close_idle(self):
+        now = time.monotonic()
+        for tenant_id, handler in list(self._open.items()):
+            if tenant_id in self._loaded or self._borrowed[tenant_id] or handler.busy():
+                continue
+            if now - self._last_used.get(tenant_id, 0.0) < self.idle_close:
+                continue
+            del self._open[tenant_id]
+            self._last_used.pop(tenant_id, None)
+            del self._borrowed[tenant_id]
+            handler.close()
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+import compiled_forest
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    x = pd.DataFrame(rng.normal(size=(400, 5)).astype(np.float32), columns=list("abcde"))
+    y = x["a"] * 2 + x["b"] ** 2 + rng.normal(scale=0.1, size=len(x))
+    #NaNs in training make sklearn learn a missing-value direction per split
+    x.iloc[::7, 1] = np.nan
+    return x, y
+
+
+@pytest.fixture(scope="module")
+def model(data):
+    x, y = data
+    return RandomForestRegressor(n_estimators=20, max_depth=8, random_state=0).fit(x, y)
+
+
+def test_predict_matches_sklearn(data, model):
+    x, _ = data
+    forest = compiled_forest.CompiledForest.from_sklearn(model)
+    assert np.allclose(forest.predict(x), model.predict(x))
+
+
+def test_predict_matches_sklearn_with_nan(data, model):
+    x, _ = data
+    x = x.copy()
+    x.iloc[::3, 0] = np.nan
+    x.iloc[::5, 1] = np.nan
+    forest = compiled_forest.CompiledForest.from_sklearn(model)
+    assert np.allclose(forest.predict(x), model.predict(x))
+
+
+def test_predict_chunks_and_column_order(data, model):
+    x, _ = data
+    forest = compiled_forest.CompiledForest.from_sklearn(model)
+    shuffled = x[["e", "c", "a", "d", "b"]]
+    assert np.allclose(forest.predict(shuffled, chunk_rows=64), model.predict(x))
+
+
+def test_export_and_memory_mapped_load(tmp_path, data, model):
+    x, _ = data
+    path = str(tmp_path / "pain_model.forest")
+    compiled_forest.export(model, path, source="abc")
+    forest = compiled_forest.load(path)
+    assert forest.source == "abc"
+    assert isinstance(forest.value, np.memmap)
+    assert np.allclose(forest.predict(x), model.predict(x))
+
+
+def test_wrong_feature_count(model):
+    forest = compiled_forest.CompiledForest.from_sklearn(model)
+    with pytest.raises(ValueError):
+        forest.predict(np.zeros((3, 4), dtype=np.float32))
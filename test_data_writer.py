@@ -0,0 +1,62 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+import data_writer
+import schema
+import storage
+from config_store import ConfigStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = storage.SQLiteStore(str(tmp_path / "data.db"), schema.columns, schema.dtypes)
+    yield store
+    store.close()
+
+
+def rows(start: str, hours: int) -> pd.DataFrame:
+    index = pd.date_range(start, periods=hours, freq="h", name="time")
+    frame = pd.DataFrame({col: 1.0 for col in schema.columns}, index=index)
+    frame["is_actual"] = True
+    return frame.astype(schema.dtypes)
+
+
+def test_failing_submit_rolls_back_alone(tmp_path, store):
+    config = ConfigStore(str(tmp_path / "config.json"))
+    config.replace({"previous_time": "2024-01-01T00:00:00"})
+    writer = data_writer.DataWriter(store, config)
+
+    def good():
+        store.upsert(rows("2024-01-01", 3))
+        writer.update_config({"previous_time": "2024-01-01T02:00:00"})
+        return 3
+
+    def bad():
+        store.upsert(rows("2024-02-01", 5))
+        writer.update_config({"previous_time": "2024-02-01T04:00:00"})
+        raise RuntimeError("boom")
+
+    async def run():
+        #queued together, so both land in the same batch
+        return await asyncio.gather(writer.submit(good), writer.submit(bad), return_exceptions=True)
+
+    result, error = asyncio.run(run())
+    assert result == 3
+    assert isinstance(error, RuntimeError)
+    assert writer.batches == 1
+    assert store.count() == 3
+    assert store.bounds() == (pd.Timestamp("2024-01-01 00:00"), pd.Timestamp("2024-01-01 02:00"))
+    assert config.get()["previous_time"] == "2024-01-01T02:00:00"
+
+
+def test_submits_apply_in_order(store, tmp_path):
+    writer = data_writer.DataWriter(store, ConfigStore(str(tmp_path / "config.json")))
+
+    async def run():
+        await asyncio.gather(*(writer.submit(store.set_meta, "last", str(i)) for i in range(10)))
+
+    asyncio.run(run())
+    assert store.get_meta("last") == "9"
+    assert writer.mutations == 10
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import interpolation
+
+
+def test_linear_fill_between_logs():
+    times, values = interpolation.segments(
+        [(pd.Timestamp("2024-01-01 04:00"), 8.0)], prev=(pd.Timestamp("2024-01-01 00:00"), 0.0)
+    )
+    assert list(times) == list(pd.date_range("2024-01-01 00:00", "2024-01-01 04:00", freq="h"))
+    assert list(values) == [0.0, 2.0, 4.0, 6.0, 8.0]
+
+
+def test_step_and_decay():
+    prev = (pd.Timestamp("2024-01-01 00:00"), 6.0)
+    entry = [(pd.Timestamp("2024-01-01 02:00"), 2.0)]
+    _, step = interpolation.segments(entry, prev, strategy="step")
+    assert list(step) == [6.0, 6.0, 2.0]
+    _, decay = interpolation.segments(entry, prev, strategy="decay", half_life=1.0)
+    assert list(decay) == [6.0, 3.0, 2.0]
+
+
+def test_unordered_entries_and_shared_endpoints():
+    entries = [(pd.Timestamp("2024-01-01 02:00"), 4.0), (pd.Timestamp("2024-01-01 00:00"), 0.0),
+               (pd.Timestamp("2024-01-01 03:00"), 1.0)]
+    times, values = interpolation.segments(entries)
+    assert times.is_unique and times.is_monotonic_increasing
+    assert list(values) == [0.0, 2.0, 4.0, 1.0]
+
+
+def test_prev_after_entries_is_ignored():
+    times, values = interpolation.segments(
+        [(pd.Timestamp("2024-01-01 00:00"), 3.0)], prev=(pd.Timestamp("2024-01-02 00:00"), 9.0)
+    )
+    assert list(times) == [pd.Timestamp("2024-01-01 00:00")]
+    assert list(values) == [3.0]
+
+
+def test_long_gap_holds_to_end_of_day():
+    prev = (pd.Timestamp("2024-01-01 20:00"), 5.0)
+    times, values = interpolation.segments([(pd.Timestamp("2024-01-10 08:00"), 2.0)], prev, max_gap_hours=72)
+    assert list(times) == list(pd.date_range("2024-01-01 20:00", "2024-01-01 23:00", freq="h")) + [pd.Timestamp("2024-01-10 08:00")]
+    assert np.array_equal(values, [5.0, 5.0, 5.0, 5.0, 2.0])
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        interpolation.segments([(pd.Timestamp("2024-01-01 01:00"), 1.0)], (pd.Timestamp("2024-01-01"), 0.0), strategy="cubic")
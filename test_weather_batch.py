@@ -0,0 +1,79 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import http_client
+import stub_server
+from weather_batch import BatchWeatherFetcher, refresh_window
+from weather_cache import WeatherCache
+
+VARIABLES = ["temperature_2m", "surface_pressure"]
+
+
+def fetcher(tmp_path, http=None, url="http://stub/v1/forecast", **kwargs):
+    return BatchWeatherFetcher(http, WeatherCache(str(tmp_path / "cache.db")), url, VARIABLES, min_interval=0, **kwargs)
+
+
+def days(offset_first: int, offset_last: int):
+    today = date.today()
+    return str(today + timedelta(days=offset_first)), str(today + timedelta(days=offset_last))
+
+
+def test_overlapping_ranges_share_a_request(tmp_path):
+    batch = fetcher(tmp_path)
+    plan = batch.plan([(1.0, 2.0, "UTC", *days(-1, 7)), (3.0, 4.0, "UTC", *days(2, 9))])
+    assert len(plan) == 1
+    locations, start, end = plan[0]
+    assert (str(start), str(end)) == days(-1, 9)
+    #every location keeps its own range, sliced out of the combined response
+    assert [(str(first), str(last)) for *_, (first, last) in locations] == [days(-1, 7), days(2, 9)]
+
+
+def test_same_location_merged(tmp_path):
+    batch = fetcher(tmp_path)
+    plan = batch.plan([(1.0, 2.0, "UTC", *days(0, 3)), (1.0, 2.0, "UTC", *days(2, 7))])
+    assert len(plan) == 1 and len(plan[0][0]) == 1
+    assert tuple(map(str, plan[0][0][0][3])) == days(0, 7)
+
+
+def test_far_apart_ranges_and_max_days(tmp_path):
+    batch = fetcher(tmp_path, max_days=31)
+    plan = batch.plan([(1.0, 2.0, "UTC", *days(-60, -55)), (3.0, 4.0, "UTC", *days(0, 7))])
+    assert len(plan) == 2
+    batch = fetcher(tmp_path, max_days=10)
+    plan = batch.plan([(1.0, 2.0, "UTC", *days(-5, 1)), (3.0, 4.0, "UTC", *days(1, 8))])
+    assert len(plan) == 2
+
+
+def test_split_by_locations_and_url_length(tmp_path):
+    requests = [(float(i), float(i), "UTC", *days(0, 7)) for i in range(10)]
+    assert [len(p[0]) for p in fetcher(tmp_path, max_locations=4).plan(requests)] == [4, 4, 2]
+    plan = fetcher(tmp_path, max_url_length=300).plan(requests)
+    assert len(plan) > 1 and sum(len(p[0]) for p in plan) == 10
+
+
+def test_refresh_window():
+    assert refresh_window(None) is None
+    config = {"lat": 1.0, "log": 2.0, "timezone": "UTC", "previous_time": "2024-01-01T05:00:00"}
+    window = refresh_window(config, now=datetime(2024, 1, 10))
+    assert window[3:] == ("2024-01-01", "2024-01-17")
+
+
+def test_fetch_many_fills_cache_from_stub(tmp_path):
+    async def run():
+        runner, base = await stub_server.start_stub()
+        client = http_client.HttpClient(retries=0)
+        batch = fetcher(tmp_path, client, f"{base}/v1/forecast", max_locations=2)
+        requests = [(40.0 + i, -74.0, "UTC", *days(-1, 7)) for i in range(3)]
+        try:
+            made = await batch.fetch_many(requests)
+            again = await batch.fetch_many(requests)
+        finally:
+            await client.close()
+            await runner.cleanup()
+        return batch, requests, made, again
+
+    batch, requests, made, again = asyncio.run(run())
+    assert (made, again) == (2, 0)
+    for lat, lon, tz, past, future in requests:
+        assert batch.cache.stale_range(lat, lon, tz, VARIABLES, past, future) is None
+        assert len(batch.cache.assemble(lat, lon, tz, VARIABLES, past, future)["hourly"]["time"]) == 9 * 24
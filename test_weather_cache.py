@@ -0,0 +1,86 @@
+import asyncio
+import time
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import http_client
+import stub_server
+from weather_cache import WeatherCache, location_key, variables_key
+
+VARIABLES = ["temperature_2m", "surface_pressure"]
+TZ = "UTC"
+
+
+def day_response(day: date) -> dict:
+    return stub_server.forecast_body(40.0, -74.0, TZ, VARIABLES, day, day)
+
+
+def cache_at(cache, day: date, fetched_at: float):
+    #as if the day had been fetched at `fetched_at`
+    cache._write(location_key(40.0, -74.0, TZ), variables_key(VARIABLES), VARIABLES, day_response(day), fetched_at)
+
+
+def test_missing_days_are_stale(tmp_path):
+    cache = WeatherCache(str(tmp_path / "cache.db"))
+    today = date.today()
+    cache.store(40.0, -74.0, TZ, VARIABLES, day_response(today))
+    assert cache.stale_range(40.0, -74.0, TZ, VARIABLES, str(today), str(today)) is None
+    tomorrow = today + timedelta(days=1)
+    assert cache.stale_range(40.0, -74.0, TZ, VARIABLES, str(today), str(tomorrow)) == (tomorrow, tomorrow)
+
+
+def test_settled_hours_never_expire(tmp_path):
+    cache = WeatherCache(str(tmp_path / "cache.db"))
+    day = date.today() - timedelta(days=10)
+    #fetched 5 days after the day, it was an actual already
+    cache_at(cache, day, time.time() - 5 * 86400)
+    assert cache.stale_range(40.0, -74.0, TZ, VARIABLES, str(day), str(day)) is None
+
+
+def test_past_hours_cached_as_forecast_expire(tmp_path):
+    cache = WeatherCache(str(tmp_path / "cache.db"))
+    day = date.today() - timedelta(days=5)
+    #fetched 10 days ago, before the day happened
+    cache_at(cache, day, time.time() - 10 * 86400)
+    assert cache.stale_range(40.0, -74.0, TZ, VARIABLES, str(day), str(day)) == (day, day)
+
+
+def test_forecast_hours_expire_after_ttl(tmp_path):
+    cache = WeatherCache(str(tmp_path / "cache.db"), forecast_ttl=3600)
+    day = date.today() + timedelta(days=2)
+    cache_at(cache, day, time.time() - 600)
+    assert cache.stale_range(40.0, -74.0, TZ, VARIABLES, str(day), str(day)) is None
+    cache_at(cache, day, time.time() - 7200)
+    assert cache.stale_range(40.0, -74.0, TZ, VARIABLES, str(day), str(day)) == (day, day)
+
+
+def test_get_fetches_only_stale_days_from_stub(tmp_path):
+    async def run():
+        runner, base = await stub_server.start_stub()
+        client = http_client.HttpClient(retries=0)
+        cache = WeatherCache(str(tmp_path / "cache.db"))
+        calls = []
+
+        async def fetch(start_date, end_date):
+            calls.append((start_date, end_date))
+            params = {
+                "latitude": 40.0, "longitude": -74.0, "timezone": TZ, "hourly": ",".join(VARIABLES),
+                "start_date": start_date, "end_date": end_date,
+            }
+            return await client.get_json(f"{base}/v1/forecast", params=params)
+
+        today = datetime.now(ZoneInfo(TZ)).date()
+        try:
+            first = await cache.get(fetch, 40.0, -74.0, TZ, VARIABLES, str(today), str(today + timedelta(days=1)))
+            second = await cache.get(fetch, 40.0, -74.0, TZ, VARIABLES, str(today), str(today + timedelta(days=2)))
+        finally:
+            await client.close()
+            await runner.cleanup()
+            cache.close()
+        return today, calls, first, second
+
+    today, calls, first, second = asyncio.run(run())
+    assert calls == [(str(today), str(today + timedelta(days=1))), (str(today + timedelta(days=2)),) * 2]
+    assert len(first["hourly"]["time"]) == 48
+    assert len(second["hourly"]["time"]) == 72
+    assert second["hourly"]["temperature_2m"][:48] == first["hourly"]["temperature_2m"]
@@ -0,0 +1,145 @@
+"""
+Bounded-memory training sets.
+
+Training jobs get a Source (the tenant's data.db + a memory budget) instead of a frame.
+The worker streams the labeled rows out of the feature store chunk by chunk into a
+memory-mapped float32 matrix next to data.db - sklearn fits on it without another copy -
+and at most the most recent row_budget() rows are used, so peak memory is set by the
+budget (JOINTBOT_TRAIN_MEMORY_MB), not by how many years of history are stored.
+With `archive` the compacted months (see retention.py) come first, oldest to newest,
+the budget still keeping only the most recent rows. Backfilled hours no pain write has
+covered yet (store.insert_unlabeled) aren't labels and are left out.
+"""
+import itertools
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+import features
+import retention
+import schema
+import storage
+
+#memory a training job may use for its data, the forest itself comes on top
+MEMORY_MB = float(os.getenv("JOINTBOT_TRAIN_MEMORY_MB", "256"))
+#train on the archive tier too - labeled hours older than the hot tier only live there
+ARCHIVE = os.getenv("JOINTBOT_TRAIN_ARCHIVE", "1") == "1"
+#bytes per cell kept in RAM besides the matrix : fold / bootstrap indices, predictions, y
+OVERHEAD = 2.0
+#a row costs ~8KB while in flight from SQLite (one python object per cell), chunks get 10% of the budget
+ROW_READ_BYTES = 8_000
+CHUNK_SHARE = 0.1
+
+
+class Source(NamedTuple):
+    """Picklable reference to a tenant's labeled hours, opened by the process that trains."""
+    db_path: str
+    memory_mb: float = MEMORY_MB
+    archive: bool = ARCHIVE
+
+
+def row_budget(n_columns: int, memory_mb: float = MEMORY_MB) -> int:
+    """Rows of `n_columns` float32 features (+ label) that fit the budget."""
+    row_bytes = (n_columns + 1) * 4 * OVERHEAD
+    return max(int(memory_mb * 1_000_000 / row_bytes), 24 * 7)
+
+
+def chunk_rows(memory_mb: float = MEMORY_MB) -> int:
+    """Rows read from the store at a time within the budget."""
+    return min(max(int(memory_mb * 1_000_000 * CHUNK_SHARE / ROW_READ_BYTES), 500), 20_000)
+
+
+def window_start(store, memory_mb: float = MEMORY_MB):
+    """First labeled hour a training job with this budget uses (None without labeled hours)."""
+    return store.recent_start(row_budget(len(schema.conditions + store.feature_columns), memory_mb), is_actual=True, labeled=True)
+
+
+def uses_archive(store, source: Source, start) -> bool:
+    """Whether a training set from window_start() `start` is topped up with archived hours."""
+    return source.archive and start == store.bounds(is_actual=True, labeled=True)[0]
+
+
+def archive_signature(source: Source) -> list:
+    """[(segment, size, mtime)] of the source's archive - changes whenever an archived hour does."""
+    signature = []
+    for _, path in retention.segments(retention.archive_dir(source.db_path)):
+        st = os.stat(path)
+        signature.append((os.path.basename(path), st.st_size, st.st_mtime_ns))
+    return signature
+
+
+def iter_labeled(store, start=None, rows: int = None):
+    """Labeled feature rows in chunks of `rows`, oldest first (what FeatureStore.read(is_actual=True) returns, in pieces)."""
+    for chunk in store.iter_features(start=start, is_actual=True, chunk_rows=rows or chunk_rows(), labeled=True):
+        yield features.typed(chunk)
+
+
+@contextmanager
+def open_source(source: Source):
+    """
+    Yields (x, y) for the most recent labeled hours that fit source.memory_mb, x a DataFrame
+    over a temporary memory map (removed on exit), y a float32 Series, both sorted by time.
+    """
+    #ml imports this module
+    import ml
+
+    store = storage.SQLiteStore(source.db_path, schema.columns, schema.dtypes)
+    path = None
+    try:
+        #column order of ml.get_features() on a feature store frame
+        names = schema.conditions + store.feature_columns
+        #count and stream from one snapshot, hours committed / compacted meanwhile can't skew the window
+        with store.snapshot():
+            start = window_start(store, source.memory_mb)
+            rows = store.count(start=start, is_actual=True, labeled=True)
+            chunks = iter_labeled(store, start, chunk_rows(source.memory_mb))
+            directory = retention.archive_dir(source.db_path)
+            found = retention.segments(directory) if uses_archive(store, source, start) else []
+            if found:
+                #the whole hot tier fits, fill the rest of the budget from the newest archived hours.
+                #segments aren't covered by the snapshot : a month compacted since it began is
+                #archived but still hot here, those hours come from the snapshot only
+                last = found[-1][0] + pd.offsets.MonthBegin(1) - pd.Timedelta(hours=1)
+                hot = store.read(end=last, is_actual=True, labeled=True, columns=["is_actual"]).index
+                archived = retention.archive_rows(directory, found, exclude=hot)
+                take = min(archived, row_budget(len(names), source.memory_mb) - rows)
+                skip = archived - take
+                rows += take
+                archive = retention.iter_archive(directory, found=found, exclude=hot)
+                chunks = itertools.chain(_skip_rows(archive, skip), chunks)
+
+            fd, path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(source.db_path)), prefix=".train-", suffix=".npy")
+            os.close(fd)
+            x = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(rows, len(names)))
+            y = np.empty(rows, dtype=np.float32)
+            index = np.empty(rows, dtype="datetime64[ns]")
+            filled = 0
+            for chunk in chunks:
+                chunk = chunk.iloc[:rows - filled]
+                n = len(chunk)
+                x[filled:filled + n] = ml.get_features(chunk)[names].to_numpy(dtype=np.float32)
+                y[filled:filled + n] = ml.get_labels(chunk).to_numpy(dtype=np.float32)
+                index[filled:filled + n] = chunk.index.to_numpy()
+                filled += n
+            x.flush()
+
+        time_index = pd.DatetimeIndex(index[:filled], name="time")
+        frame = pd.DataFrame(x[:filled], index=time_index, columns=names, copy=False)
+        yield frame, pd.Series(y[:filled], index=time_index, name="pain_level")
+    finally:
+        store.close()
+        if path is not None:
+            os.remove(path)
+
+
+def _skip_rows(chunks, rows: int):
+    for chunk in chunks:
+        if rows >= len(chunk):
+            rows -= len(chunk)
+            continue
+        yield chunk.iloc[rows:]
+        rows = 0
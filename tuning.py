@@ -0,0 +1,202 @@
+"""
+Hyperparameter search for the pain model.
+
+    python tuning.py --dir users/<user id> --budget 600
+
+Successive halving over randomly sampled forests : every candidate is scored with
+walk-forward CV on the most recent slice of the labeled history, the best third move
+on to a bigger slice, and so on until the full history. Candidates run in a pool of
+TUNE_WORKERS processes and the search stops at the wall-clock budget, keeping whatever
+finished - evaluations still running then are terminated, nothing outlives the budget.
+The winner is written to model_config.json next to the model, ml.update_model uses it.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+
+import numpy as np
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import TimeSeriesSplit
+
+import compiled_forest
+import ml
+
+SEARCH_SPACE = {
+    "n_estimators": [25, 50, 100, 200, 300],
+    "max_depth": [4, 6, 8, 10, 12, 15, None],
+    "min_samples_leaf": [1, 2, 5, 10, 20],
+    "max_features": [1.0, 0.7, 0.5, 0.3, "sqrt"],
+}
+#rows in one forecast, latency is measured predicting this many
+FORECAST_ROWS = 168
+#evaluation processes per search, half the cores by default so the bot's own training keeps some
+TUNE_WORKERS = int(os.getenv("JOINTBOT_TUNE_WORKERS", "0")) or max(1, (os.cpu_count() or 2) // 2)
+
+#set per worker by _init_worker, the frame is sent once per process instead of once per task
+_x = None
+_y = None
+
+
+def sample_configs(n: int, seed: int = 0, baseline=None) -> list:
+    """`n` distinct random configs, the config in use (`baseline`) always among them."""
+    rng = random.Random(seed)
+    configs = [dict(baseline or ml.MODEL_CONFIG)]
+    seen = {json.dumps(configs[0], sort_keys=True)}
+    for _ in range(n * 20):
+        if len(configs) >= n:
+            break
+        config = {name: rng.choice(values) for name, values in SEARCH_SPACE.items()}
+        config["random_state"] = ml.MODEL_CONFIG["random_state"]
+        key = json.dumps(config, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+def objective(result: dict, latency_weight: float = 0.01, size_weight: float = 0.02) -> float:
+    """CV MSE, inflated by 1% per ms of forecast latency and 2% per MB of model (by default)."""
+    return result["mse"] * (1 + latency_weight * result["latency_ms"] + size_weight * result["size_mb"])
+
+
+def _init_worker(x, y):
+    global _x, _y
+    _x, _y = x, y
+
+
+def evaluate(config: dict, fraction: float, n_splits: int = 3) -> dict:
+    """Walk-forward CV of `config` on the most recent `fraction` of the labeled hours."""
+    x, y = _x, _y
+    rows = max(int(len(x) * fraction), min(len(x), 24 * (n_splits + 1)))
+    x, y = x.iloc[-rows:], y.iloc[-rows:]
+
+    start = time.perf_counter()
+    errors = []
+    for train_idx, test_idx in TimeSeriesSplit(n_splits=n_splits).split(x):
+        model = ml.make_model(config, n_jobs=1)
+        ml.fit(model, x.iloc[train_idx], y.iloc[train_idx])
+        errors.append(mean_squared_error(y.iloc[test_idx], model.predict(x.iloc[test_idx])))
+    fit_s = time.perf_counter() - start
+
+    #latency / size of what the bot would actually serve
+    forest = compiled_forest.CompiledForest.from_sklearn(model)
+    sample = np.asarray(x.iloc[-FORECAST_ROWS:], dtype=np.float32)
+    timings = []
+    for _ in range(5):
+        t = time.perf_counter()
+        forest.predict(sample)
+        timings.append(time.perf_counter() - t)
+    return {
+        "config": config,
+        "rows": rows,
+        "mse": float(np.mean(errors)),
+        "latency_ms": round(min(timings) * 1000, 3),
+        "size_mb": round(forest.nbytes / 1e6, 3),
+        "fit_s": round(fit_s, 3),
+    }
+
+
+def choose(results: list, tolerance: float = 0.05) -> dict:
+    """Smallest model whose MSE is within `tolerance` of the best, ties broken by objective."""
+    best_mse = min(result["mse"] for result in results)
+    good = [result for result in results if result["mse"] <= best_mse * (1 + tolerance)]
+    return min(good, key=lambda result: (result["size_mb"], objective(result)))
+
+
+def search(data, budget: float = 300, candidates: int = 27, eta: int = 3, workers=None,
+           tolerance: float = 0.05, seed: int = 0, current=None) -> dict:
+    """
+    data = labeled feature frame (FeatureStore.read(is_actual=True)) or a training_data.Source.
+    Returns {"best": result, "baseline": result or None, "evaluated": n, "rungs": n, "time_s": s}
+    """
+    with ml.labeled(data) as (x, y):
+        return _search(x, y, budget, candidates, eta, workers, tolerance, seed, current)
+
+
+def _search(x, y, budget, candidates, eta, workers, tolerance, seed, current) -> dict:
+    started = time.perf_counter()
+    deadline = started + budget
+    if len(x) < 24 * 4:
+        raise ValueError(f"Not enough labeled hours to tune ({len(x)})")
+
+    current = current or ml.MODEL_CONFIG
+    configs = sample_configs(candidates, seed, current)
+    rungs = 1
+    while eta ** rungs < len(configs):
+        rungs += 1
+    fractions = [1 / eta ** (rungs - 1 - r) for r in range(rungs)]
+
+    baseline = None
+    evaluated = 0
+    finished = []
+    executor = ProcessPoolExecutor(max_workers=workers or TUNE_WORKERS, initializer=_init_worker, initargs=(x, y))
+    pending = set()
+    try:
+        for r, fraction in enumerate(fractions):
+            pending = {executor.submit(evaluate, config, fraction) for config in configs}
+            results = []
+            while pending:
+                done, pending = wait(pending, timeout=max(deadline - time.perf_counter(), 0), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                results += [future.result() for future in done]
+            evaluated += len(results)
+            if results:
+                finished = results
+            if fraction == 1:
+                baseline = next((res for res in results if res["config"] == current), None)
+            if pending:
+                print(f"Tuning budget ({budget}s) reached in rung {r + 1}/{rungs}")
+                break
+            results.sort(key=objective)
+            configs = [result["config"] for result in results[:max(1, len(results) // eta)]]
+    finally:
+        if pending:
+            _terminate(executor)
+        else:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    if not finished:
+        raise TimeoutError(f"No configuration finished within the {budget}s budget")
+    return {
+        "best": choose(finished, tolerance),
+        "baseline": baseline,
+        "evaluated": evaluated,
+        "rungs": rungs,
+        "time_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def _terminate(executor: ProcessPoolExecutor):
+    """Stops a pool with evaluations still running - they'd otherwise keep a core busy past the budget."""
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def tune(data, model_name: str, budget: float = 300, workers=None) -> dict:
+    """Runs the search and persists the winning config for update_model."""
+    report = search(data, budget=budget, workers=workers, current=ml.load_model_config(model_name))
+    ml.save_model_config(model_name, dict(report["best"], tuned_at=datetime.now().isoformat(timespec="seconds")))
+    return report
+
+
+if __name__ == "__main__":
+    import training_data
+
+    parser = argparse.ArgumentParser(description="Tune the pain model's hyperparameters")
+    parser.add_argument("--dir", default=".", help="tenant directory holding data.db / pain_model.pkl")
+    parser.add_argument("--budget", type=float, default=300, help="wall-clock seconds")
+    parser.add_argument("--workers", type=int, help=f"processes, defaults to {TUNE_WORKERS}")
+    args = parser.parse_args()
+
+    source = training_data.Source(os.path.join(args.dir, "data.db"))
+    report = tune(source, os.path.join(args.dir, "pain_model.pkl"), args.budget, args.workers)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+from zoneinfo import ZoneInfo
+
+import perf
+
+
+def refresh_window(config, now=None):
+    """
+    (lat, lon, timezone, past, future) covering every weather fetch the scheduled
+    refreshes make for this config (intraday from previous_time, daily from yesterday
+    to next week), or None without a location.
+    """
+    if not config or 'lat' not in config:
+        return None
+    now = now or datetime.now(ZoneInfo(config['timezone'])).replace(tzinfo=None)
+    past = (now - timedelta(days=1)).date()
+    if config.get('previous_time'):
+        past = min(past, datetime.fromisoformat(config['previous_time']).date())
+    future = (now + timedelta(days=7)).date()
+    return (config['lat'], config['log'], config['timezone'], str(past), str(future))
+
+
+class BatchWeatherFetcher:
+    """
+    Refreshes many locations with as few Open-Meteo calls as possible.
+    Open-Meteo accepts comma separated latitude / longitude (and timezone) lists and
+    answers with one result per coordinate, so pending (location, date range) refreshes
+    whose day ranges overlap or touch are merged (spanning at most `max_days`) and packed
+    into one request - split by URL length and locations per request, spaced out by
+    `min_interval`. Every location's own stale days are sliced back out of the combined
+    response into the shared weather cache, where each tenant's get_weather finds them.
+    """
+
+    def __init__(self, http, cache, url, variables, max_url_length=4000, max_locations=50, min_interval=0.25,
+                 max_days=31):
+        self.http = http
+        self.cache = cache
+        self.url = url
+        self.variables = list(variables)
+        self.max_url_length = max_url_length
+        self.max_locations = max_locations
+        self.min_interval = min_interval
+        self.max_days = max_days
+        self._pace = asyncio.Lock()
+        self._last_request = 0.0
+
+    def _params(self, locations, start, end) -> dict:
+        return {
+            "latitude": ",".join(str(location[0]) for location in locations),
+            "longitude": ",".join(str(location[1]) for location in locations),
+            "timezone": ",".join(location[2] for location in locations),
+            "hourly": ",".join(self.variables),
+            "start_date": str(start),
+            "end_date": str(end),
+        }
+
+    def _url_length(self, locations, start, end) -> int:
+        return len(self.url) + 1 + len(urlencode(self._params(locations, start, end)))
+
+    def plan(self, requests) -> list:
+        """
+        requests = iterable of (lat, lon, timezone, past, future)
+        Returns [(locations, start, end)] - one entry per HTTP request still needed, every
+        location as (lat, lon, timezone, (first_day, last_day) it needs).
+        """
+        pending = {}
+        for lat, lon, tz, past, future in requests:
+            stale = self.cache.stale_range(lat, lon, tz, self.variables, past, future)
+            if stale is None:
+                continue
+            #tenants sharing a location need one range covering all of them
+            first, last = pending.get((lat, lon, tz), stale)
+            pending[(lat, lon, tz)] = (min(first, stale[0]), max(last, stale[1]))
+
+        #overlapping / adjacent ranges merge into one request range
+        groups = []
+        for (lat, lon, tz), (first, last) in sorted(pending.items(), key=lambda item: item[1]):
+            if groups:
+                start, end, locations = groups[-1]
+                merged_end = max(end, last)
+                if first <= end + timedelta(days=1) and (merged_end - start).days < self.max_days:
+                    groups[-1] = (start, merged_end, locations + [(lat, lon, tz, (first, last))])
+                    continue
+            groups.append((first, last, [(lat, lon, tz, (first, last))]))
+
+        batches = []
+        for start, end, locations in groups:
+            chunk = []
+            for location in locations:
+                candidate = chunk + [location]
+                too_long = self._url_length(candidate, start, end) > self.max_url_length
+                if chunk and (too_long or len(candidate) > self.max_locations):
+                    batches.append((chunk, start, end))
+                    candidate = [location]
+                chunk = candidate
+            if chunk:
+                batches.append((chunk, start, end))
+        return batches
+
+    async def _paced(self):
+        #rate limit - requests start at least min_interval apart
+        async with self._pace:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_request = time.monotonic()
+
+    async def _fetch(self, locations, start, end):
+        await self._paced()
+        response = await self.http.get_json(self.url, params=self._params(locations, start, end))
+        results = response if isinstance(response, list) else [response]
+        for (lat, lon, tz, (first, last)), result in zip(locations, results):
+            self.cache.store(lat, lon, tz, self.variables, _slice(result, first, last))
+
+    @perf.timed("weather.batch_refresh")
+    async def fetch_many(self, requests) -> int:
+        """Fills the cache for every request, returns the number of HTTP requests made."""
+        batches = self.plan(requests)
+        await asyncio.gather(*(self._fetch(*batch) for batch in batches))
+        if batches:
+            print(f"Batch weather refresh : {sum(len(b[0]) for b in batches)} location(s) in {len(batches)} request(s)")
+        return len(batches)
+
+
+def _slice(response: dict, first, last) -> dict:
+    """The hours of an Open-Meteo response that fall on days [first, last]."""
+    hourly = response["hourly"]
+    keep = [i for i, t in enumerate(hourly["time"]) if str(first) <= t[:10] <= str(last)]
+    sliced = {key: [values[i] for i in keep] for key, values in hourly.items()}
+    return dict(response, hourly=sliced)
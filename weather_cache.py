@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+HOUR_FORMAT = "%Y-%m-%dT%H:%M"
+
+
+def location_key(lat, lon, timezone) -> str:
+    return f"{float(lat):.4f},{float(lon):.4f},{timezone}"
+
+
+def variables_key(variables) -> str:
+    return hashlib.sha1(",".join(variables).encode()).hexdigest()[:12]
+
+
+class WeatherCache:
+    """
+    Disk-persisted, per-hour cache of Open-Meteo hourly responses keyed by
+    (lat, lon, timezone, variable set, hour).
+    - hours fetched at least `settle` after they happened are actuals and effectively
+      immutable (past_ttl, None = forever)
+    - everything else, including past hours cached while they were still a forecast,
+      expires after forecast_ttl so forecasts refresh roughly hourly
+    Only the day range that is missing or expired gets fetched. One cache is shared by
+    every tenant - users at the same coordinates share the cached hours, and concurrent
+    misses for one location wait on a single fetch.
+    """
+
+    def __init__(self, path="weather_cache.db", past_ttl=None, forecast_ttl=3600, settle=timedelta(days=1)):
+        self.path = path
+        self.past_ttl = past_ttl
+        self.forecast_ttl = forecast_ttl
+        self.settle = settle
+        self._locks: dict[str, asyncio.Lock] = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS hours ("
+                "location TEXT, variables TEXT, time TEXT, fetched_at REAL, data TEXT, "
+                "PRIMARY KEY (location, variables, time)) WITHOUT ROWID"
+            )
+
+    def _is_fresh(self, hour: datetime, fetched_at: float, zone: ZoneInfo, wall: float) -> bool:
+        #an hour only settles once it was fetched after it happened, not merely because it is old now
+        settled = fetched_at >= (hour + self.settle).replace(tzinfo=zone).timestamp()
+        ttl = self.past_ttl if settled else self.forecast_ttl
+        return ttl is None or wall - fetched_at < ttl
+
+    def _read(self, location, variables, start: str, end: str) -> dict:
+        rows = self.conn.execute(
+            "SELECT time, fetched_at, data FROM hours WHERE location = ? AND variables = ? AND time BETWEEN ? AND ?",
+            (location, variables, start, end),
+        )
+        return {t: (fetched_at, data) for t, fetched_at, data in rows}
+
+    def _write(self, location, variables_id, variables, response: dict, wall: float):
+        hourly = response["hourly"]
+        rows = [
+            (location, variables_id, t, wall, json.dumps([hourly[v][i] for v in variables]))
+            for i, t in enumerate(hourly["time"])
+        ]
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO hours VALUES (?, ?, ?, ?, ?)", rows)
+
+    def stale_range(self, lat, lon, timezone, variables, past: str, future: str):
+        """(first_day, last_day) that needs fetching for [past, future], or None if fully cached."""
+        location, variables_id = location_key(lat, lon, timezone), variables_key(variables)
+        first, last = date.fromisoformat(str(past)), date.fromisoformat(str(future))
+        start = datetime(first.year, first.month, first.day)
+        hours = int((last - first).days + 1) * 24
+
+        cached = self._read(location, variables_id, start.strftime(HOUR_FORMAT),
+                            (start + timedelta(hours=hours - 1)).strftime(HOUR_FORMAT))
+        zone = ZoneInfo(timezone)
+        wall = time.time()
+
+        stale_days = []
+        for i in range(hours):
+            hour = start + timedelta(hours=i)
+            entry = cached.get(hour.strftime(HOUR_FORMAT))
+            if entry is None or not self._is_fresh(hour, entry[0], zone, wall):
+                stale_days.append(hour.date())
+        if not stale_days:
+            return None
+        return min(stale_days), max(stale_days)
+
+    def store(self, lat, lon, timezone, variables, response: dict):
+        """Caches every hour of an Open-Meteo response."""
+        self._write(location_key(lat, lon, timezone), variables_key(variables), variables, response, time.time())
+
+    def assemble(self, lat, lon, timezone, variables, past: str, future: str) -> dict:
+        """Builds an Open-Meteo shaped response for [past, future] from the cached hours."""
+        location, variables_id = location_key(lat, lon, timezone), variables_key(variables)
+        first, last = date.fromisoformat(str(past)), date.fromisoformat(str(future))
+        cached = self._read(location, variables_id, f"{first}T00:00", f"{last}T23:00")
+
+        hourly = {"time": []}
+        hourly.update({v: [] for v in variables})
+        for t in sorted(cached):
+            values = json.loads(cached[t][1])
+            hourly["time"].append(t)
+            for v, value in zip(variables, values):
+                hourly[v].append(value)
+        return {"latitude": lat, "longitude": lon, "timezone": timezone, "hourly": hourly}
+
+    async def get(self, fetch, lat, lon, timezone, variables, past: str, future: str) -> dict:
+        """
+        Returns hourly weather for [past, future], calling `fetch(start_date, end_date)` only
+        for the missing / expired sub-range.
+        """
+        key = location_key(lat, lon, timezone) + variables_key(variables)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            #re-checked under the lock, a concurrent caller may have just filled the range
+            stale = self.stale_range(lat, lon, timezone, variables, past, future)
+            if stale is not None:
+                response = await fetch(str(stale[0]), str(stale[1]))
+                self.store(lat, lon, timezone, variables, response)
+        return self.assemble(lat, lon, timezone, variables, past, future)
+
+    def close(self):
+        self.conn.close()